@@ -1,4 +1,10 @@
+import collections
+import collections.abc
+import heapq
 import itertools
+import os
+import pickle
+import tempfile
 from functools import reduce
 import operator
 
@@ -24,7 +30,8 @@ def rfind(xs, x):
 
     Raises `ValueError` if `x` is not in `xs`
     '''
-    return (len(xs) - 1) - xs[::-1].index(x)
+    # scan backwards with a reverse iterator, rather than copying xs[::-1]
+    return (len(xs) - 1) - operator.indexOf(reversed(xs), x)
 
 
 def jaccard(A, B):
@@ -54,18 +61,59 @@ def window(iterable, n):
 
     If the desired window length is longer than iterable, yields nothing.
 
-    From https://docs.python.org/release/2.3.5/lib/itertools-example.html
-        via http://stackoverflow.com/a/6822773/424651
+    The windows are built by zipping n staggered copies of the iterator
+    (via itertools.tee), so each tuple is constructed once, in C, rather
+    than by slicing and concatenating the previous window.
+
+    For zero-copy windows over a numpy array, use window_view.
+    '''
+    iterators = itertools.tee(iterable, n)
+    for i, iterator in enumerate(iterators):
+        # advance the i-th copy by i elements
+        next(itertools.islice(iterator, i, i), None)
+    return zip(*iterators)
+
+
+def window_view(array, n):
+    '''
+    Like window, but for a numpy array: returns a read-only view (no copy) of
+    array with shape (len(array) - n + 1, n) + array.shape[1:], whose i-th
+    element is the window array[i:i + n]. If n is longer than array, the
+    view is empty.
+    '''
+    import numpy as np
+    if len(array) < n:
+        return np.empty((0, n) + array.shape[1:], dtype=array.dtype)
+    windows = np.lib.stride_tricks.sliding_window_view(array, n, axis=0)
+    # sliding_window_view puts the window axis last; move it to second
+    return np.moveaxis(windows, -1, 1)
+
+
+def count_ngrams(iterable, n, counts=None):
+    '''
+    Count the n-grams (windows of width n) in iterable, without building a
+    list of them, adding to counts (any mutable mapping, e.g., a Counter or
+    AlgebraicDict) if given, or else to a new Counter. Returns counts.
+
+    If iterable is a 1D numpy array, the n-grams are counted in bulk with
+    numpy.unique over window_view(iterable, n), which copies the windows into
+    a temporary (len(iterable) - n + 1) by n array.
     '''
-    iterable = iter(iterable)
-    # initialize with the first window
-    result = tuple(itertools.islice(iterable, n))
-    if len(result) == n:
-        yield result
-    # incrementally pop and push onto the result tuple for the rest of the items
-    for elem in iterable:
-        result = result[1:] + (elem,)
-        yield result
+    if counts is None:
+        counts = collections.Counter()
+    if getattr(iterable, 'ndim', None) == 1:
+        import numpy as np
+        grams, gram_counts = np.unique(window_view(iterable, n), axis=0, return_counts=True)
+        ngrams = zip(map(tuple, grams.tolist()), gram_counts.tolist())
+    elif isinstance(counts, collections.Counter):
+        # Counter.update counts an iterable in C
+        counts.update(window(iterable, n))
+        return counts
+    else:
+        ngrams = ((gram, 1) for gram in window(iterable, n))
+    for gram, count in ngrams:
+        counts[gram] = counts.get(gram, 0) + count
+    return counts
 
 
 def prefixes(xs):
@@ -94,6 +142,76 @@ def suffixes(xs):
         yield xs[len(xs) - i:]
 
 
+class SequenceView(collections.abc.Sequence):
+    '''
+    A read-only view onto a range of the indices of a sequence, which, unlike
+    a slice, does not copy any elements. Slicing a SequenceView returns
+    another SequenceView of the same underlying sequence.
+
+    >>> view = SequenceView('ABCDE')[1:4]
+    >>> len(view), view[0], tuple(view[::2])
+    (3, 'B', ('B', 'D'))
+    '''
+    def __init__(self, sequence, indices=None):
+        self.sequence = sequence
+        self.indices = range(len(sequence)) if indices is None else indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SequenceView(self.sequence, self.indices[index])
+        return self.sequence[self.indices[index]]
+
+    def __iter__(self):
+        return map(self.sequence.__getitem__, self.indices)
+
+    def __reversed__(self):
+        return map(self.sequence.__getitem__, reversed(self.indices))
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.abc.Sequence) or isinstance(other, str) != isinstance(self.sequence, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return 'SequenceView({!r})'.format(list(self))
+
+
+def view(xs):
+    '''
+    Return a view of xs whose slices do not copy: xs itself if it's a numpy
+    array (whose slices are already views), a memoryview if it's a bytes-like
+    object, and otherwise a SequenceView.
+    '''
+    if hasattr(xs, 'ndim') and hasattr(xs, 'strides'):
+        return xs
+    if isinstance(xs, (bytes, bytearray, memoryview)):
+        return memoryview(xs)
+    return SequenceView(xs)
+
+
+def prefix_views(xs):
+    '''
+    Like prefixes, but yields views (see view) rather than copies, so that
+    iterating over all the prefixes of a long sequence takes O(n) rather than
+    O(n^2) time and memory.
+    '''
+    xs_view = view(xs)
+    for i in range(len(xs) + 1):
+        yield xs_view[:i]
+
+
+def suffix_views(xs):
+    '''
+    Like suffixes, but yields views (see view) rather than copies.
+    '''
+    xs_view = view(xs)
+    for i in range(len(xs) + 1):
+        yield xs_view[len(xs) - i:]
+
+
 def product(xs):
     '''
     Compute the product of all values in `xs`. Returns 1 if `xs` is empty.
@@ -106,6 +224,8 @@ def pick(mapping, keys):
     '''
     Return a new dict that's identical to `mapping` but includes only the
     key-value pairs that have a key in `keys`.
+
+    To pick the same keys from many mappings, use a Picker.
     '''
     keyset = set(keys)
     return {key: value for key, value in mapping.items() if key in keyset}
@@ -115,6 +235,8 @@ def omit(mapping, keys):
     '''
     Return a new dict that's identical to `mapping` but excludes any key-value
     pairs that have a key in `keys`.
+
+    To omit the same keys from many mappings, use an Omitter.
     '''
     keyset = set(keys)
     return {key: value for key, value in mapping.items() if key not in keyset}
@@ -125,7 +247,7 @@ def invert(mapping):
     Return a new dict that maps from the values of `mapping` to their original
     keys.
     '''
-    return {value: key for key, value in mapping.items()}
+    return dict(zip(mapping.values(), mapping.keys()))
 
 
 def select(indexable, indices):
@@ -133,8 +255,141 @@ def select(indexable, indices):
     Pick the items from indexable with the indices in `indices`.
     Useful when you want to use something like numpy's indexing feature without
     using numpy's arrays.
-    '''
-    return [indexable[index] for index in indices]
+
+    To select from the same indexable many times, use a Selector.
+    '''
+    if hasattr(indices, 'tolist'):
+        # numpy array of indices: convert to Python ints in one call
+        indices = indices.tolist()
+    return list(map(indexable.__getitem__, indices))
+
+
+class Picker(object):
+    '''
+    A compiled pick(..., keys): the keys are deduplicated, and their set (and
+    an operator.itemgetter) built, once, rather than on every call.
+
+    Calling a Picker on a mapping loops over whichever is smaller: the keys
+    (looking each one up in the mapping) or the mapping (checking each key
+    against the key set). So, unlike pick, the result's keys are in the
+    Picker's key order when the mapping has at least as many entries as there
+    are keys, and in the mapping's order otherwise.
+
+    Use like:
+
+        picker = Picker(['id', 'name'])
+        picked = [picker(record) for record in records]
+    '''
+    def __init__(self, keys):
+        self.keys = tuple(dict.fromkeys(keys))
+        self.keyset = frozenset(self.keys)
+        if not self.keys:
+            self.getter = lambda mapping: ()
+        elif len(self.keys) == 1:
+            key = self.keys[0]
+            self.getter = lambda mapping: (mapping[key],)
+        else:
+            self.getter = operator.itemgetter(*self.keys)
+
+    def __repr__(self):
+        return 'Picker(%r)' % (list(self.keys),)
+
+    def __call__(self, mapping):
+        if len(self.keys) <= len(mapping):
+            return {key: mapping[key] for key in self.keys if key in mapping}
+        keyset = self.keyset
+        return {key: value for key, value in mapping.items() if key in keyset}
+
+    def values_many(self, records):
+        '''
+        Iterate over tuples of the values of the keys in each record (which
+        must have all of the keys), in key order, extracted with a single
+        operator.itemgetter call per record.
+        '''
+        return map(self.getter, records)
+
+    def pick_many(self, records):
+        '''
+        Iterate over picked dicts, one per record. Records that have all of the
+        keys (the usual case, for uniform records) take the operator.itemgetter
+        path; the others fall back to self(record).
+        '''
+        keys = self.keys
+        getter = self.getter
+        for record in records:
+            try:
+                yield dict(zip(keys, getter(record)))
+            except KeyError:
+                yield self(record)
+
+
+class Omitter(object):
+    '''
+    A compiled omit(..., keys): the key set is built once, rather than on
+    every call.
+
+    Calling an Omitter on a mapping with more entries than there are keys to
+    omit copies the mapping (in C) and pops the keys, rather than testing
+    every one of the mapping's keys against the key set.
+    '''
+    def __init__(self, keys):
+        self.keys = tuple(dict.fromkeys(keys))
+        self.keyset = frozenset(self.keys)
+
+    def __repr__(self):
+        return 'Omitter(%r)' % (list(self.keys),)
+
+    def __call__(self, mapping):
+        if len(self.keys) < len(mapping):
+            result = dict(mapping)
+            for key in self.keys:
+                result.pop(key, None)
+            return result
+        keyset = self.keyset
+        return {key: value for key, value in mapping.items() if key not in keyset}
+
+    def omit_many(self, records):
+        '''
+        Iterate over the results of calling self on each record.
+        '''
+        return map(self, records)
+
+
+class Selector(object):
+    '''
+    A compiled select(indexable, ...): indexable is converted to a numpy array
+    (of objects, unless it's already an array) once, so that each call with
+    an array of integer indices is a single vectorized fancy-indexing
+    operation.
+
+    Use like:
+
+        selector = Selector(names)
+        selector(np.array([3, 1, 4]))
+        selector.take(np.array([3, 1, 4]))
+    '''
+    def __init__(self, indexable):
+        import numpy as np
+        if hasattr(indexable, 'ndim'):
+            self.array = indexable
+        else:
+            self.array = np.empty(len(indexable), dtype=object)
+            self.array[:] = indexable
+
+    def __len__(self):
+        return len(self.array)
+
+    def take(self, indices):
+        '''
+        Return the numpy array of the items at indices.
+        '''
+        return self.array[indices]
+
+    def __call__(self, indices):
+        '''
+        Like select(indexable, indices): return a list of the items at indices.
+        '''
+        return self.take(indices).tolist()
 
 
 def uniq(iterable, keyfunc=None):
@@ -153,7 +408,17 @@ def uniq_c(iterable, keyfunc=None):
     Like uniq, but yields tuples of (value, count), kind of like POSIX `uniq -c`
     '''
     for value, values in itertools.groupby(iterable, keyfunc):
-        yield value, len(list(values))
+        yield value, ilen(values)
+
+
+def ilen(iterable):
+    '''
+    Count the items in iterable by consuming it, without storing them.
+    '''
+    counter = itertools.count()
+    # a zero-length deque consumes the zip at C speed, discarding every item
+    collections.deque(zip(iterable, counter), maxlen=0)
+    return next(counter)
 
 
 def groupby_select(iterable, keyfunc, valfunc):
@@ -174,6 +439,91 @@ def strict_groupby(iterable, keyfunc):
         yield key, list(sub_iterator)
 
 
+def aggregate_by(iterable, keyfunc, aggregate='count', valfunc=None, initial=None):
+    '''
+    Group the items in iterable by keyfunc and aggregate each group, in a
+    single pass, using a hashtable rather than sorting, and without storing
+    the groups. Returns a dict mapping each key to its aggregate.
+
+    aggregate can be 'count', 'sum', 'min', 'max', 'first', or 'last', or a
+    reducer function of (accumulated, value), like functools.reduce's, which
+    starts from `initial` if it's given, or else from the first value in each
+    group. Values are valfunc(item), or the items themselves if valfunc is
+    None.
+
+    >>> aggregate_by(['apple', 'avocado', 'banana'], lambda word: word[0])
+    {'a': 2, 'b': 1}
+    >>> aggregate_by(['apple', 'avocado', 'banana'], lambda word: word[0], 'max', len)
+    {'a': 7, 'b': 6}
+    '''
+    if aggregate == 'count':
+        return dict(collections.Counter(map(keyfunc, iterable)))
+    if valfunc is None:
+        pairs = ((keyfunc(item), item) for item in iterable)
+    else:
+        pairs = ((keyfunc(item), valfunc(item)) for item in iterable)
+    result = {}
+    if aggregate == 'first':
+        for key, value in pairs:
+            if key not in result:
+                result[key] = value
+    elif aggregate == 'last':
+        result.update(pairs)
+    elif aggregate == 'sum':
+        get = result.get
+        for key, value in pairs:
+            result[key] = get(key, 0) + value
+    elif aggregate in ('min', 'max'):
+        better = operator.lt if aggregate == 'min' else operator.gt
+        for key, value in pairs:
+            if key not in result or better(value, result[key]):
+                result[key] = value
+    elif callable(aggregate):
+        for key, value in pairs:
+            if key in result:
+                result[key] = aggregate(result[key], value)
+            else:
+                result[key] = value if initial is None else aggregate(initial, value)
+    else:
+        raise ValueError('Unrecognized aggregate: {!r}'.format(aggregate))
+    return result
+
+
+def external_groupby(iterable, keyfunc, chunk_size=1000000, directory=None):
+    '''
+    Like strict_groupby, but for inputs larger than memory: iterable is read
+    chunk_size items at a time; each chunk is sorted and pickled to a temporary
+    file in directory (see tempfile), and then all the sorted runs are merged
+    (with heapq.merge) and grouped.
+
+    Like itertools.groupby, yields (key, iterator over group) pairs, and each
+    group's iterator must be consumed before advancing to the next.
+    '''
+    with tempfile.TemporaryDirectory(dir=directory) as temp_directory:
+        iterator = iter(iterable)
+        run_paths = []
+        while True:
+            chunk = sorted(itertools.islice(iterator, chunk_size), key=keyfunc)
+            if not chunk:
+                break
+            run_path = os.path.join(temp_directory, '%d.pickle' % len(run_paths))
+            with open(run_path, 'wb') as fp:
+                for item in chunk:
+                    pickle.dump(item, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            run_paths.append(run_path)
+        runs = [_iter_pickles(run_path) for run_path in run_paths]
+        yield from itertools.groupby(heapq.merge(*runs, key=keyfunc), keyfunc)
+
+
+def _iter_pickles(path):
+    with open(path, 'rb') as fp:
+        while True:
+            try:
+                yield pickle.load(fp)
+            except EOFError:
+                return
+
+
 def margins(xs, ordering=None, width=25):
     '''
     Reorder xs by the given ordering and return a tuple of a slice of the top
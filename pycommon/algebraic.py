@@ -1,8 +1,38 @@
-import collections
+import collections.abc
+import heapq
 import operator
 
+from pycommon import get1
 
-class AlgebraicDict(collections.MutableMapping):
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+_hows = ('left', 'right', 'inner', 'outer')
+
+
+def _partition_keys(lhs, rhs, how):
+    '''
+    Split the keys of two mappings, according to the join type `how`, into a
+    tuple of (shared keys, keys only in lhs, keys only in rhs).
+
+    The shared keys are found by iterating over the smaller mapping and probing
+    the larger one, so an inner join does work proportional to the smaller
+    mapping rather than to the sum of their sizes. The one-sided keys are only
+    computed when `how` includes them in the result.
+    '''
+    if how not in _hows:
+        raise ValueError('how must be one of {}, not {!r}'.format(_hows, how))
+    small, large = (lhs, rhs) if len(lhs) <= len(rhs) else (rhs, lhs)
+    shared = {key for key in small if key in large}
+    lhs_only = [key for key in lhs if key not in shared] if how in ('left', 'outer') else []
+    rhs_only = [key for key in rhs if key not in shared] if how in ('right', 'outer') else []
+    return shared, lhs_only, rhs_only
+
+
+class AlgebraicDict(collections.abc.MutableMapping):
     '''
     AlgebraicDict is a dict-like structure that makes it easy to manipulate
     hashtables. It supports element-wise operations like a numpy array, but is
@@ -41,10 +71,61 @@ class AlgebraicDict(collections.MutableMapping):
 
     # add more functionality via operator overloads
 
-    def _apply_operator(self, op_func, rhs):
-        if isinstance(rhs, collections.MutableMapping):
-            return AlgebraicDict({key: op_func(self[key], rhs[key]) for key in self})
-        return AlgebraicDict({key: op_func(self[key], rhs) for key in self})
+    def _apply_operator(self, op_func, rhs, how='left', fill=None):
+        if not isinstance(rhs, collections.abc.Mapping):
+            return AlgebraicDict({key: op_func(value, rhs) for key, value in self._dict.items()})
+        if how == 'left' and fill is None:
+            return AlgebraicDict({key: op_func(value, rhs[key]) for key, value in self._dict.items()})
+        shared, lhs_only, rhs_only = _partition_keys(self._dict, rhs, how)
+        if fill is None and (lhs_only or rhs_only):
+            raise KeyError(next(iter(lhs_only or rhs_only)))
+        result = {key: op_func(self._dict[key], rhs[key]) for key in shared}
+        result.update((key, op_func(self._dict[key], fill)) for key in lhs_only)
+        result.update((key, op_func(fill, rhs[key])) for key in rhs_only)
+        return AlgebraicDict(result)
+
+    def add(self, rhs, how='left', fill=None):
+        '''
+        Element-wise addition, with control over how keys are aligned when rhs
+        is a mapping, much like pandas' DataFrame.add:
+
+        * how='left' (the default) keeps the keys of self
+        * how='right' keeps the keys of rhs
+        * how='inner' keeps only the keys in both
+        * how='outer' keeps the keys in either
+
+        Keys missing from one side take the value `fill`; if `fill` is None,
+        a missing key raises KeyError (which is what the operators do).
+
+        E.g., to combine two sparse count tables:
+
+            total = counts_a.add(counts_b, how='outer', fill=0)
+        '''
+        return self._apply_operator(operator.add, rhs, how, fill)
+
+    def sub(self, rhs, how='left', fill=None):
+        '''
+        Element-wise subtraction; see add() for the meaning of how and fill.
+        '''
+        return self._apply_operator(operator.sub, rhs, how, fill)
+
+    def mul(self, rhs, how='left', fill=None):
+        '''
+        Element-wise multiplication; see add() for the meaning of how and fill.
+        '''
+        return self._apply_operator(operator.mul, rhs, how, fill)
+
+    def truediv(self, rhs, how='left', fill=None):
+        '''
+        Element-wise division; see add() for the meaning of how and fill.
+        '''
+        return self._apply_operator(operator.truediv, rhs, how, fill)
+
+    def pow(self, rhs, how='left', fill=None):
+        '''
+        Element-wise exponentiation; see add() for the meaning of how and fill.
+        '''
+        return self._apply_operator(operator.pow, rhs, how, fill)
 
     def __add__(self, rhs):
         '''
@@ -85,6 +166,43 @@ class AlgebraicDict(collections.MutableMapping):
     def __abs__(self):
         return AlgebraicDict({key: abs(value) for key, value in self.items()})
 
+    # in-place operators mutate self rather than allocating a new dict
+
+    def _apply_operator_inplace(self, op_func, rhs):
+        items = self._dict.items()
+        if isinstance(rhs, collections.abc.Mapping):
+            # check up front so that a missing key does not leave self half-updated
+            for key in self._dict:
+                if key not in rhs:
+                    raise KeyError(key)
+            for key, value in items:
+                self._dict[key] = op_func(value, rhs[key])
+        else:
+            for key, value in items:
+                self._dict[key] = op_func(value, rhs)
+        return self
+
+    def __iadd__(self, rhs):
+        return self._apply_operator_inplace(operator.add, rhs)
+
+    def __isub__(self, rhs):
+        return self._apply_operator_inplace(operator.sub, rhs)
+
+    def __imul__(self, rhs):
+        return self._apply_operator_inplace(operator.mul, rhs)
+
+    def __itruediv__(self, rhs):
+        return self._apply_operator_inplace(operator.truediv, rhs)
+
+    def __ipow__(self, rhs):
+        return self._apply_operator_inplace(operator.pow, rhs)
+
+    def lazy(self):
+        '''
+        Start a lazy AlgebraicExpression rooted at self; see AlgebraicExpression.
+        '''
+        return AlgebraicExpression(self)
+
     # and a few more useful
 
     def sum(self):
@@ -99,3 +217,748 @@ class AlgebraicDict(collections.MutableMapping):
         Returns a new AlgebraicDict `norm` such that `norm.sum() == 1`
         '''
         return self / self.sum()
+
+    def normalize(self):
+        '''
+        Like normalized(), but rescales self in place.
+        '''
+        self /= self.sum()
+
+    # reductions
+
+    def max(self):
+        return max(self._dict.values())
+
+    def min(self):
+        return min(self._dict.values())
+
+    def argmax(self):
+        '''
+        Return the key with the largest value (in a single pass).
+        '''
+        return max(self._dict.items(), key=get1)[0]
+
+    def argmin(self):
+        '''
+        Return the key with the smallest value (in a single pass).
+        '''
+        return min(self._dict.items(), key=get1)[0]
+
+    def mean(self):
+        return self.sum() / len(self._dict)
+
+    def dot(self, rhs):
+        '''
+        Return the sum of the products of the values of the keys shared by self
+        and rhs (any mapping), i.e., a sparse dot product. Iterates over the
+        smaller of the two mappings.
+        '''
+        small, large = (self._dict, rhs) if len(self._dict) <= len(rhs) else (rhs, self._dict)
+        return sum(value * large[key] for key, value in small.items() if key in large)
+
+    def norm(self, p=2):
+        '''
+        Return the L`p` norm of the values; p=float('inf') gives the largest
+        absolute value.
+        '''
+        if p == float('inf'):
+            return max(abs(value) for value in self._dict.values())
+        return sum(abs(value) ** p for value in self._dict.values()) ** (1 / p)
+
+    def most_common(self, k=None):
+        '''
+        Return a list of the `k` (key, value) pairs with the largest values,
+        largest first, like Counter.most_common. Uses a bounded heap, so it
+        takes O(n log k) rather than sorting everything. If `k` is None,
+        returns all pairs.
+        '''
+        if k is None:
+            return sorted(self._dict.items(), key=get1, reverse=True)
+        return heapq.nlargest(k, self._dict.items(), key=get1)
+
+    def least_common(self, k=None):
+        '''
+        Like most_common, but for the `k` smallest values, smallest first.
+        '''
+        if k is None:
+            return sorted(self._dict.items(), key=get1)
+        return heapq.nsmallest(k, self._dict.items(), key=get1)
+
+
+def _compile_operand(operand):
+    '''
+    Return a tuple of (function from key to value, is_constant) for a node in
+    an AlgebraicExpression tree.
+    '''
+    if isinstance(operand, AlgebraicExpression):
+        return operand._compile(), False
+    if isinstance(operand, collections.abc.Mapping):
+        return operand.__getitem__, False
+    return operand, True
+
+
+# the numpy ufuncs equivalent to the operators used in AlgebraicExpressions
+_ufunc_names = {
+    operator.add: 'add',
+    operator.sub: 'subtract',
+    operator.mul: 'multiply',
+    operator.truediv: 'true_divide',
+    operator.pow: 'power',
+    operator.abs: 'absolute',
+}
+
+
+def _evaluate_operand_into(operand, out, mask):
+    '''
+    Write the values of operand (an AlgebraicExpression or ArrayAlgebraicDict)
+    at the positions in mask into the numpy array out.
+    '''
+    if isinstance(operand, AlgebraicExpression):
+        operand._evaluate_into(out, mask)
+    else:
+        values, operand_mask = operand._arrays()
+        values = operand._filled(values, operand_mask, mask, None)
+        np.copyto(out, values, where=mask, casting='unsafe')
+
+
+class AlgebraicExpression(object):
+    '''
+    AlgebraicExpression records a chain of element-wise operations over
+    mappings and numbers without computing anything. Calling evaluate() fuses
+    the whole chain into a single pass over the keys, so an expression like
+    `(a - b) ** 2 / c` allocates only the result, rather than one full-size
+    temporary per operator.
+
+    The result has the keys of the leftmost mapping in the expression, and, as
+    with AlgebraicDict's operators, other mappings missing one of those keys
+    raise KeyError.
+
+    E.g.:
+
+        distance = ((a.lazy() - b) ** 2 / c).evaluate()
+
+    Pass out=some_mapping to evaluate() to write the results into an existing
+    mapping (which may be one of the operands) instead of a new AlgebraicDict.
+    '''
+    def __init__(self, operand, op_func=None, rhs=None):
+        self.operand = operand
+        self.op_func = op_func
+        self.rhs = rhs
+
+    def __repr__(self):
+        if self.op_func is None:
+            return '<AlgebraicExpression({size} keys)>'.format(size=len(self.operand))
+        return '<AlgebraicExpression({op}({lhs!r}, {rhs!r}))>'.format(
+            op=self.op_func.__name__, lhs=self.operand, rhs=self.rhs)
+
+    def _keys(self):
+        '''
+        Return the leftmost mapping in the expression tree.
+        '''
+        for operand in (self.operand, self.rhs):
+            if isinstance(operand, AlgebraicExpression):
+                keys = operand._keys()
+                if keys is not None:
+                    return keys
+            elif isinstance(operand, collections.abc.Mapping):
+                return operand
+        return None
+
+    def _compile(self):
+        '''
+        Compose the expression tree into a single function from key to value.
+        '''
+        lhs, lhs_constant = _compile_operand(self.operand)
+        if self.op_func is None:
+            return lhs
+        op_func = self.op_func
+        rhs, rhs_constant = _compile_operand(self.rhs)
+        if self.rhs is None:
+            # unary operator
+            return lambda key: op_func(lhs(key))
+        if lhs_constant:
+            return lambda key: op_func(lhs, rhs(key))
+        if rhs_constant:
+            return lambda key: op_func(lhs(key), rhs)
+        return lambda key: op_func(lhs(key), rhs(key))
+
+    def _array_dtype(self, index):
+        '''
+        Return the dtype of the result of evaluating the expression with numpy,
+        or None if it can't be, because some mapping in it is not an
+        ArrayAlgebraicDict over index (or some operator has no ufunc).
+        '''
+        dtypes = []
+        for operand in (self.operand, self.rhs):
+            if isinstance(operand, AlgebraicExpression):
+                dtype = operand._array_dtype(index)
+                if dtype is None:
+                    return None
+                dtypes.append(dtype)
+            elif isinstance(operand, ArrayAlgebraicDict):
+                if operand.index is not index:
+                    return None
+                dtypes.append(operand._values.dtype)
+            elif isinstance(operand, collections.abc.Mapping):
+                return None
+            elif operand is not None:
+                dtypes.append(np.result_type(operand))
+        if self.op_func is None:
+            return dtypes[0]
+        if self.op_func not in _ufunc_names:
+            return None
+        dtype = np.result_type(*dtypes)
+        # like Python (and ArrayAlgebraicDict), / and negative powers produce floats
+        nonnegative_exponent = not isinstance(self.rhs, (AlgebraicExpression, collections.abc.Mapping)) and \
+            self.rhs is not None and self.rhs >= 0
+        if self.op_func is operator.truediv or (self.op_func is operator.pow and not nonnegative_exponent):
+            dtype = np.result_type(dtype, float)
+        return dtype
+
+    def _evaluate_into(self, out, mask):
+        '''
+        Write the values of the expression, at the positions in mask, into the
+        numpy array out, with one ufunc call per operator, each writing in
+        place. Only subexpressions on the right of an operator need a
+        temporary array.
+        '''
+        lhs, rhs = self.operand, self.rhs
+        lhs_constant = not isinstance(lhs, (AlgebraicExpression, collections.abc.Mapping))
+        if lhs_constant:
+            _evaluate_operand_into(rhs, out, mask)
+        else:
+            _evaluate_operand_into(lhs, out, mask)
+        if self.op_func is None:
+            return
+        ufunc = getattr(np, _ufunc_names[self.op_func])
+        if rhs is None:
+            # unary operator
+            ufunc(out, out=out, where=mask)
+        elif lhs_constant:
+            ufunc(lhs, out, out=out, where=mask)
+        elif isinstance(rhs, (AlgebraicExpression, collections.abc.Mapping)):
+            rhs_values = np.zeros_like(out)
+            _evaluate_operand_into(rhs, rhs_values, mask)
+            ufunc(out, rhs_values, out=out, where=mask)
+        else:
+            ufunc(out, rhs, out=out, where=mask)
+
+    def _evaluate_arrays(self, keys, dtype, out):
+        '''
+        Evaluate the expression with numpy, over the positions of keys (an
+        ArrayAlgebraicDict), into a new ArrayAlgebraicDict, or into out.
+        '''
+        _, mask = keys._arrays()
+        mask = mask.copy()
+        values = np.zeros(len(mask), dtype=dtype)
+        self._evaluate_into(values, mask)
+        result = ArrayAlgebraicDict._from_arrays(keys.index, values, mask)
+        if out is None:
+            return result
+        if isinstance(out, ArrayAlgebraicDict) and out.index is keys.index:
+            out._reserve(len(mask))
+            if not np.can_cast(dtype, out._values.dtype, 'same_kind'):
+                out._values = out._values.astype(np.result_type(out._values.dtype, dtype))
+            out_values, out_mask = out._arrays()
+            np.copyto(out_values, values, where=mask, casting='unsafe')
+            out_mask |= mask
+            return out
+        out.update(result)
+        return out
+
+    def evaluate(self, out=None):
+        '''
+        Compute the expression in one pass over the keys, returning a new
+        AlgebraicDict, or `out` (after updating it) if given.
+
+        If the leftmost mapping is an ArrayAlgebraicDict, and all the other
+        mappings are ArrayAlgebraicDicts over the same KeyIndex, the expression
+        is instead computed with one vectorized, in-place ufunc call per
+        operator, and the result is a new ArrayAlgebraicDict.
+        '''
+        keys = self._keys()
+        if keys is None:
+            raise ValueError('AlgebraicExpression must contain at least one mapping')
+        if isinstance(keys, ArrayAlgebraicDict):
+            dtype = self._array_dtype(keys.index)
+            if dtype is not None:
+                return self._evaluate_arrays(keys, dtype, out)
+        function = self._compile()
+        if out is None:
+            return AlgebraicDict({key: function(key) for key in keys})
+        for key in list(keys) if keys is out else keys:
+            out[key] = function(key)
+        return out
+
+    def __add__(self, rhs):
+        return AlgebraicExpression(self, operator.add, rhs)
+
+    def __radd__(self, lhs):
+        return AlgebraicExpression(lhs, operator.add, self)
+
+    def __sub__(self, rhs):
+        return AlgebraicExpression(self, operator.sub, rhs)
+
+    def __rsub__(self, lhs):
+        return AlgebraicExpression(lhs, operator.sub, self)
+
+    def __mul__(self, rhs):
+        return AlgebraicExpression(self, operator.mul, rhs)
+
+    def __rmul__(self, lhs):
+        return AlgebraicExpression(lhs, operator.mul, self)
+
+    def __truediv__(self, rhs):
+        return AlgebraicExpression(self, operator.truediv, rhs)
+
+    def __rtruediv__(self, lhs):
+        return AlgebraicExpression(lhs, operator.truediv, self)
+
+    def __pow__(self, rhs):
+        return AlgebraicExpression(self, operator.pow, rhs)
+
+    def __rpow__(self, lhs):
+        return AlgebraicExpression(lhs, operator.pow, self)
+
+    def __abs__(self):
+        return AlgebraicExpression(self, operator.abs)
+
+
+class KeyIndex(object):
+    '''
+    KeyIndex interns hashable keys as consecutive integer positions. It is
+    append-only, so positions never change once assigned, which lets many
+    ArrayAlgebraicDict instances share a single index and line up their value
+    arrays position-by-position.
+
+    E.g.:
+
+        index = KeyIndex()
+        a = ArrayAlgebraicDict(Counter(doc_a), index=index)
+        b = ArrayAlgebraicDict(Counter(doc_b), index=index)
+    '''
+    def __init__(self, keys=()):
+        self._positions = {}
+        self._keys = []
+        self.update(keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __repr__(self):
+        return '<KeyIndex({size} keys)>'.format(size=len(self._keys))
+
+    def get(self, key, default=None):
+        '''
+        Return the position of `key`, or `default` if it has not been interned.
+        '''
+        return self._positions.get(key, default)
+
+    def add(self, key):
+        '''
+        Return the position of `key`, interning it at the end if necessary.
+        '''
+        position = self._positions.get(key)
+        if position is None:
+            position = self._positions[key] = len(self._keys)
+            self._keys.append(key)
+        return position
+
+    def update(self, keys):
+        '''
+        Intern all of `keys` and return a numpy array of their positions.
+        '''
+        add = self.add
+        return np.fromiter((add(key) for key in keys), dtype=np.intp)
+
+    def key(self, position):
+        return self._keys[position]
+
+
+_join_masks = {
+    'left': lambda lhs_mask, rhs_mask: lhs_mask,
+    'right': lambda lhs_mask, rhs_mask: rhs_mask,
+    'inner': operator.and_,
+    'outer': operator.or_,
+}
+
+
+class ArrayAlgebraicDict(collections.abc.MutableMapping):
+    '''
+    ArrayAlgebraicDict is a drop-in alternative to AlgebraicDict that stores its
+    values in a contiguous numpy array, indexed through a KeyIndex that can be
+    shared with other instances. Element-wise operators between instances with
+    the same index, as well as sum(), normalized(), and abs(), run as single
+    vectorized numpy calls rather than one Python call per key.
+
+    A boolean mask records which positions of the (shared) index are actually
+    present in this mapping, so different instances can cover different subsets
+    of the same vocabulary.
+
+    Requires numpy.
+    '''
+    def __init__(self, *args, index=None, dtype=float, **kwargs):
+        if np is None:
+            raise ImportError('ArrayAlgebraicDict requires numpy')
+        mapping = dict(*args, **kwargs)
+        self.index = KeyIndex() if index is None else index
+        positions = self.index.update(mapping.keys())
+        self._values = np.zeros(len(self.index), dtype=dtype)
+        self._mask = np.zeros(len(self.index), dtype=bool)
+        self._values[positions] = np.fromiter(mapping.values(), dtype=dtype, count=len(mapping))
+        self._mask[positions] = True
+
+    @classmethod
+    def _from_arrays(cls, index, values, mask):
+        instance = cls.__new__(cls)
+        instance.index = index
+        instance._values = values
+        instance._mask = mask
+        return instance
+
+    def _reserve(self, size):
+        '''
+        Grow the value and mask arrays to hold at least `size` positions,
+        over-allocating geometrically so that repeated insertions of new keys
+        are amortized O(1).
+        '''
+        capacity = len(self._values)
+        if capacity < size:
+            capacity = max(size, 2 * capacity)
+            values = np.zeros(capacity, dtype=self._values.dtype)
+            values[:len(self._values)] = self._values
+            mask = np.zeros(capacity, dtype=bool)
+            mask[:len(self._mask)] = self._mask
+            self._values, self._mask = values, mask
+
+    def _arrays(self):
+        '''
+        Return (values, mask) views covering exactly the positions of the index.
+        '''
+        size = len(self.index)
+        self._reserve(size)
+        return self._values[:size], self._mask[:size]
+
+    @property
+    def values_array(self):
+        '''
+        The numpy array of values, in iteration (key) order.
+        '''
+        values, mask = self._arrays()
+        return values[mask]
+
+    # implement the basic dict operations
+
+    def __getitem__(self, key):
+        position = self.index.get(key)
+        if position is None or position >= len(self._mask) or not self._mask[position]:
+            raise KeyError(key)
+        return self._values[position].item()
+
+    def __setitem__(self, key, value):
+        position = self.index.add(key)
+        self._reserve(position + 1)
+        self._values[position] = value
+        self._mask[position] = True
+
+    def __delitem__(self, key):
+        position = self.index.get(key)
+        if position is None or position >= len(self._mask) or not self._mask[position]:
+            raise KeyError(key)
+        self._mask[position] = False
+
+    def __iter__(self):
+        _, mask = self._arrays()
+        key = self.index.key
+        return (key(position) for position in np.flatnonzero(mask))
+
+    def __len__(self):
+        return int(np.count_nonzero(self._mask))
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    # add more functionality via operator overloads
+
+    def _gather(self, rhs, mask):
+        '''
+        Return the values of rhs (any mapping) lined up with self.index, for the
+        positions in mask. Missing keys raise KeyError, like AlgebraicDict.
+        '''
+        key = self.index.key
+        positions = np.flatnonzero(mask)
+        picked = np.asarray([rhs[key(position)] for position in positions])
+        gathered = np.zeros(len(mask), dtype=picked.dtype if len(picked) else self._values.dtype)
+        gathered[positions] = picked
+        return gathered
+
+    def _gather_join(self, rhs, how):
+        '''
+        Return (values, mask) arrays for rhs (any mapping) lined up with
+        self.index, covering only the keys that the `how` join needs: the keys
+        shared with self, plus, for right and outer joins, the keys only in
+        rhs, which are the only ones added to the index. The values keep rhs's
+        own dtype.
+        '''
+        shared, _, rhs_only = _partition_keys(self, rhs, how)
+        keys = list(shared)
+        keys.extend(rhs_only)
+        index = self.index
+        positions = np.fromiter(map(index.get, shared), dtype=np.intp, count=len(shared))
+        if rhs_only:
+            positions = np.concatenate([positions, index.update(rhs_only)])
+        picked = np.asarray([rhs[key] for key in keys])
+        values = np.zeros(len(index), dtype=picked.dtype if len(picked) else self._values.dtype)
+        mask = np.zeros(len(index), dtype=bool)
+        values[positions] = picked
+        mask[positions] = True
+        return values, mask
+
+    def _filled(self, values, mask, result_mask, fill):
+        '''
+        Fill the positions that are in result_mask but not in mask with `fill`,
+        raising KeyError for the first such position if fill is None.
+        '''
+        missing = result_mask & ~mask
+        if not missing.any():
+            return values
+        if fill is None:
+            raise KeyError(self.index.key(np.flatnonzero(missing)[0]))
+        return np.where(missing, fill, values)
+
+    def _result_dtype(self, ufunc, lhs, rhs, mask):
+        '''
+        Return the dtype of ufunc(lhs, rhs) over the positions in mask, found by
+        computing on empty slices (e.g., int / int -> float). Like Python ints,
+        integers raised to negative powers produce floats.
+        '''
+        dtype = ufunc(lhs[:0], rhs[:0] if isinstance(rhs, np.ndarray) else rhs).dtype
+        if ufunc is np.power and dtype.kind in 'iu' and np.any((np.asarray(rhs) < 0) & mask):
+            dtype = np.dtype(float)
+        return dtype
+
+    def _compute(self, ufunc, lhs, rhs, mask):
+        dtype = self._result_dtype(ufunc, lhs, rhs, mask)
+        if dtype != lhs.dtype:
+            lhs = lhs.astype(dtype)
+        result = np.zeros(len(lhs), dtype=dtype)
+        ufunc(lhs, rhs, out=result, where=mask)
+        return self._from_arrays(self.index, result, mask.copy())
+
+    def _apply_operator(self, ufunc, rhs, how='left', fill=None):
+        if how not in _hows:
+            raise ValueError('how must be one of {}, not {!r}'.format(_hows, how))
+        values, mask = self._arrays()
+        if not isinstance(rhs, collections.abc.Mapping):
+            return self._compute(ufunc, values, rhs, mask)
+        if not (isinstance(rhs, ArrayAlgebraicDict) and rhs.index is self.index):
+            if how == 'left' and fill is None:
+                # avoid interning foreign keys that will not be in the result
+                return self._compute(ufunc, values, self._gather(rhs, mask), mask)
+            rhs_values, rhs_mask = self._gather_join(rhs, how)
+            values, mask = self._arrays()
+        else:
+            rhs_values, rhs_mask = rhs._arrays()
+        result_mask = _join_masks[how](mask, rhs_mask)
+        lhs_values = self._filled(values, mask, result_mask, fill)
+        rhs_values = self._filled(rhs_values, rhs_mask, result_mask, fill)
+        return self._compute(ufunc, lhs_values, rhs_values, result_mask)
+
+    def add(self, rhs, how='left', fill=None):
+        '''
+        Element-wise addition; see AlgebraicDict.add() for the meaning of how
+        and fill. With a shared index, alignment is a single vectorized mask
+        operation.
+        '''
+        return self._apply_operator(np.add, rhs, how, fill)
+
+    def sub(self, rhs, how='left', fill=None):
+        return self._apply_operator(np.subtract, rhs, how, fill)
+
+    def mul(self, rhs, how='left', fill=None):
+        return self._apply_operator(np.multiply, rhs, how, fill)
+
+    def truediv(self, rhs, how='left', fill=None):
+        return self._apply_operator(np.true_divide, rhs, how, fill)
+
+    def pow(self, rhs, how='left', fill=None):
+        return self._apply_operator(np.power, rhs, how, fill)
+
+    def __add__(self, rhs):
+        '''
+        rhs can be another dict or (Array)AlgebraicDict, or a number
+        '''
+        return self._apply_operator(np.add, rhs)
+
+    def __sub__(self, rhs):
+        '''
+        rhs can be another dict or (Array)AlgebraicDict, or a number
+        '''
+        return self._apply_operator(np.subtract, rhs)
+
+    def __mul__(self, rhs):
+        '''
+        rhs can be another dict or (Array)AlgebraicDict, or a number
+        '''
+        return self._apply_operator(np.multiply, rhs)
+
+    def __truediv__(self, rhs):
+        '''
+        rhs can be another dict or (Array)AlgebraicDict, or a number
+        '''
+        return self._apply_operator(np.true_divide, rhs)
+
+    def __pow__(self, rhs):
+        '''
+        rhs can be another dict or (Array)AlgebraicDict, or a number
+        '''
+        return self._apply_operator(np.power, rhs)
+
+    def __abs__(self):
+        values, mask = self._arrays()
+        return self._from_arrays(self.index, np.absolute(values), mask.copy())
+
+    # in-place operators write straight into the value array
+
+    def _apply_operator_inplace(self, ufunc, rhs):
+        values, mask = self._arrays()
+        if isinstance(rhs, collections.abc.Mapping):
+            if isinstance(rhs, ArrayAlgebraicDict) and rhs.index is self.index:
+                rhs_values, rhs_mask = rhs._arrays()
+                rhs = self._filled(rhs_values, rhs_mask, mask, None)
+            else:
+                rhs = self._gather(rhs, mask)
+        dtype = self._result_dtype(ufunc, values, rhs, mask)
+        if dtype != values.dtype:
+            # e.g., dividing integer counts: promote the values before writing in place
+            self._values = self._values.astype(dtype)
+            values, mask = self._arrays()
+        ufunc(values, rhs, out=values, where=mask)
+        return self
+
+    def __iadd__(self, rhs):
+        return self._apply_operator_inplace(np.add, rhs)
+
+    def __isub__(self, rhs):
+        return self._apply_operator_inplace(np.subtract, rhs)
+
+    def __imul__(self, rhs):
+        return self._apply_operator_inplace(np.multiply, rhs)
+
+    def __itruediv__(self, rhs):
+        return self._apply_operator_inplace(np.true_divide, rhs)
+
+    def __ipow__(self, rhs):
+        return self._apply_operator_inplace(np.power, rhs)
+
+    def lazy(self):
+        '''
+        Start a lazy AlgebraicExpression rooted at self, which evaluates to an
+        ArrayAlgebraicDict with one in-place ufunc call per operator, as long
+        as its other mappings share self.index; see AlgebraicExpression.evaluate.
+        '''
+        return AlgebraicExpression(self)
+
+    # and a few more useful
+
+    def sum(self):
+        values, mask = self._arrays()
+        return values.sum(where=mask).item()
+
+    def normalized(self):
+        '''
+        Returns a new ArrayAlgebraicDict `norm` such that `norm.sum() == 1`
+        '''
+        return self / self.sum()
+
+    def normalize(self):
+        '''
+        Like normalized(), but rescales self in place.
+        '''
+        self /= self.sum()
+
+    # reductions
+
+    def _positions(self):
+        _, mask = self._arrays()
+        return np.flatnonzero(mask)
+
+    def max(self):
+        return self.values_array.max().item()
+
+    def min(self):
+        return self.values_array.min().item()
+
+    def argmax(self):
+        positions = self._positions()
+        return self.index.key(positions[self._values[positions].argmax()])
+
+    def argmin(self):
+        positions = self._positions()
+        return self.index.key(positions[self._values[positions].argmin()])
+
+    def mean(self):
+        return self.values_array.mean().item()
+
+    def dot(self, rhs):
+        '''
+        Return the sum of the products of the values of the keys shared by self
+        and rhs; vectorized when rhs shares self's index.
+        '''
+        if isinstance(rhs, ArrayAlgebraicDict) and rhs.index is self.index:
+            values, mask = self._arrays()
+            rhs_values, rhs_mask = rhs._arrays()
+            return np.multiply(values, rhs_values, where=mask & rhs_mask, out=np.zeros(len(values))).sum().item()
+        key = self.index.key
+        return sum(self._values[position].item() * rhs[key(position)]
+                   for position in self._positions() if key(position) in rhs)
+
+    def norm(self, p=2):
+        '''
+        Return the L`p` norm of the values; p=float('inf') gives the largest
+        absolute value.
+        '''
+        return np.linalg.norm(self.values_array, ord=p).item()
+
+    def _select(self, k, largest):
+        '''
+        Return the (key, value) pairs for the k largest (or smallest) values,
+        using np.argpartition to avoid a full sort when k is small.
+        '''
+        positions = self._positions()
+        values = self._values[positions]
+        if largest:
+            values = -values
+        if k is not None and k < len(values):
+            selected = np.argpartition(values, k)[:k] if k > 0 else np.array([], dtype=np.intp)
+            selected = selected[np.argsort(values[selected], kind='stable')]
+        else:
+            selected = np.argsort(values, kind='stable')
+        key = self.index.key
+        return [(key(position), self._values[position].item()) for position in positions[selected]]
+
+    def most_common(self, k=None):
+        '''
+        Return a list of the `k` (key, value) pairs with the largest values,
+        largest first, like Counter.most_common. If `k` is None, returns all
+        pairs.
+        '''
+        return self._select(k, True)
+
+    def least_common(self, k=None):
+        '''
+        Like most_common, but for the `k` smallest values, smallest first.
+        '''
+        return self._select(k, False)
+
+    def to_dict(self):
+        '''
+        Convert to a plain AlgebraicDict.
+        '''
+        return AlgebraicDict(self.items())
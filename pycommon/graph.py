@@ -1,6 +1,13 @@
+from array import array
 from itertools import groupby
+
 from pycommon import get0, get1
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 def iter_bidirectional(edges):
     '''
@@ -40,41 +47,393 @@ def get_component(graph, source_id):
 
     Args:
         graph: a dict mapping from nodes to sets of nodes, like the output of
-            graph_map(...)
+            graph_map(...), or a CSRGraph (whose components ignore edge
+            direction)
         source_id: the node to find all the neighbors of
 
     Returns:
         A set of nodes (generally, hashable values representing nodes)
     '''
-    processed_ids = set()
-    unprocessed_ids = set([source_id])
-    while unprocessed_ids:
-        unprocessed_id = unprocessed_ids.pop()
-        processed_ids.add(unprocessed_id)
-        # doesn't work due to redefinition in more limited scope:
-        # unprocessed_ids |= graph[unprocessed_id] - processed_ids
-        unprocessed_ids.update(graph[unprocessed_id] - processed_ids)
-    return processed_ids
+    if isinstance(graph, CSRGraph):
+        return graph.component(source_id)
+    component = {source_id}
+    stack = [source_id]
+    while stack:
+        # check membership per neighbor instead of building a set difference per visit
+        for neighbor_id in graph[stack.pop()]:
+            if neighbor_id not in component:
+                component.add(neighbor_id)
+                stack.append(neighbor_id)
+    return component
 
 
 def get_all_components(graph):
     '''
     Run get_component(...) on the given graph until all nodes have been assigned
-    to a component. Uses graph.keys() to create a queue of nodes, then calls
-    get_component(...) on each node in that queue until the queue is exhausted.
+    to a component. Iterates over graph.keys(), calling get_component(...) on
+    each node that has not yet been assigned to a component.
 
     Args:
         graph: a dict mapping from nodes to sets of nodes, like the output of
-            graph_map(...)
+            graph_map(...), or a CSRGraph (whose components ignore edge
+            direction)
 
     Returns:
         An iterator over sets of nodes. The sets comprise a partition of the
         input graph.
     '''
-    queue_ids = set(graph.keys())
-    while queue_ids:
-        # grab a random starting point id from the queue
-        next_id = queue_ids.pop()
-        component = get_component(graph, next_id)
-        queue_ids -= component
-        yield component
+    if isinstance(graph, CSRGraph):
+        yield from graph.components()
+        return
+    assigned_ids = set()
+    for node_id in graph.keys():
+        if node_id not in assigned_ids:
+            component = get_component(graph, node_id)
+            assigned_ids.update(component)
+            yield component
+
+
+class CSRGraph(object):
+    '''
+    A compressed-sparse-row representation of a graph: nodes are interned as
+    consecutive integer ids, and the targets of all edges are stored in one
+    numpy array (`indices`), grouped by source, with `offsets[i]:offsets[i + 1]`
+    delimiting the neighbors of node id i. This takes a small fraction of the
+    memory of graph_map(...)'s dict of sets.
+
+    Unlike graph_map(...), duplicate edges are not removed. Components (see
+    component() and components()) ignore edge direction; for a directed graph,
+    these are the weakly connected components, rather than the sets of nodes
+    reachable from some node.
+
+    Use like:
+
+        graph = CSRGraph(edges, bidirectional=True)
+        components = list(get_all_components(graph))
+    '''
+    def __init__(self, edges, bidirectional=False):
+        '''
+        Build the graph in a single streaming pass over edges.
+
+        Args:
+            edges: an iterable of tuples of (source, target), where source and
+                target are hashable values representing nodes.
+            bidirectional: if True, also add the reverse of each edge (like
+                passing the edges through iter_bidirectional(...) first).
+        '''
+        if np is None:
+            raise ImportError('CSRGraph requires numpy')
+        if bidirectional:
+            edges = iter_bidirectional(edges)
+        self.node_ids = {}
+        self.nodes = []
+        sources = array('q')
+        targets = array('q')
+        intern = self._intern
+        for source, target in edges:
+            sources.append(intern(source))
+            targets.append(intern(target))
+        degrees = np.bincount(np.frombuffer(sources, dtype=np.int64), minlength=len(self.nodes))
+        self.offsets = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+        np.cumsum(degrees, out=self.offsets[1:])
+        # counting sort of the edges by source id: scatter each target to the
+        # next free slot (cursor) of its source's range
+        cursors = self.offsets[:-1].tolist()
+        indices = array('q', bytes(8 * len(targets)))
+        for source_id, target_id in zip(sources, targets):
+            indices[cursors[source_id]] = target_id
+            cursors[source_id] += 1
+        self.indices = np.frombuffer(indices, dtype=np.int64)
+
+    def _intern(self, node):
+        node_id = self.node_ids.get(node)
+        if node_id is None:
+            node_id = self.node_ids[node] = len(self.nodes)
+            self.nodes.append(node)
+        return node_id
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node in self.node_ids
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def keys(self):
+        return self.nodes
+
+    def __getitem__(self, node):
+        '''
+        Return a list of the nodes that node links to.
+        '''
+        nodes = self.nodes
+        return [nodes[neighbor_id] for neighbor_id in self.neighbor_ids(self.node_ids[node])]
+
+    def neighbor_ids(self, node_id):
+        '''
+        Return a numpy array (a view, not a copy) of the ids that the node
+        with id node_id links to.
+        '''
+        return self.indices[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def component(self, node):
+        '''
+        Like get_component(...), but, like components(), ignoring edge
+        direction: return the set of nodes in the same (weakly) connected
+        component as node.
+        '''
+        labels = self._component_labels()
+        label = labels[self.node_ids[node]]
+        return {other for other, other_label in zip(self.nodes, labels) if other_label == label}
+
+    def _component_labels(self):
+        '''
+        Label the (weakly) connected components, ignoring edge direction, with
+        a union-find over node ids, in a single pass over the edges, rather
+        than a separate search per component.
+
+        Returns:
+            A list of component labels, indexed by node id, where labels are
+            consecutive integers starting at 0, in order of each component's
+            lowest node id.
+        '''
+        n = len(self.nodes)
+        parent = list(range(n))
+
+        def find(node_id):
+            while parent[node_id] != node_id:
+                # path halving: point each visited node at its grandparent
+                parent[node_id] = parent[parent[node_id]]
+                node_id = parent[node_id]
+            return node_id
+        source_ids = np.repeat(np.arange(n), np.diff(self.offsets))
+        for source_id, target_id in zip(source_ids.tolist(), self.indices.tolist()):
+            root_a = find(source_id)
+            root_b = find(target_id)
+            if root_a != root_b:
+                # link the higher root under the lower, so roots are minimal ids
+                if root_a < root_b:
+                    parent[root_b] = root_a
+                else:
+                    parent[root_a] = root_b
+        root_labels = {}
+        return [root_labels.setdefault(find(node_id), len(root_labels)) for node_id in range(n)]
+
+    def component_labels(self):
+        '''
+        Returns:
+            A numpy array of component labels, indexed by node id.
+        '''
+        return np.array(self._component_labels(), dtype=np.int64)
+
+    def components(self):
+        '''
+        Like get_all_components(...): iterate over sets of nodes, which
+        comprise a partition of the graph.
+        '''
+        components = []
+        for node, label in zip(self.nodes, self._component_labels()):
+            if label == len(components):
+                components.append(set())
+            components[label].add(node)
+        return iter(components)
+
+
+class DisjointSet(object):
+    '''
+    A union-find (disjoint-set) forest over hashable nodes, with path
+    compression (halving) and union by rank, so that any sequence of m
+    union/find operations takes O(m α(n)) time -- effectively linear.
+
+    Nodes are added implicitly the first time they are seen.
+    '''
+    def __init__(self, nodes=()):
+        self.parent = {}
+        self.rank = {}
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def __contains__(self, node):
+        return node in self.parent
+
+    def __iter__(self):
+        return iter(self.parent)
+
+    def add(self, node):
+        '''
+        Add node as a singleton set, unless it's already present.
+        '''
+        if node not in self.parent:
+            self.parent[node] = node
+            self.rank[node] = 0
+
+    def find(self, node):
+        '''
+        Return the representative (root) node of the set containing node,
+        adding node as a singleton if it has not been seen before.
+        '''
+        parent = self.parent
+        if node not in parent:
+            self.add(node)
+            return node
+        while parent[node] != node:
+            # path halving: point each visited node at its grandparent
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, a, b):
+        '''
+        Merge the sets containing a and b.
+
+        Returns:
+            The root of the merged set, or None if a and b were already in the
+            same set.
+        '''
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a == root_b:
+            return None
+        rank = self.rank
+        if rank[root_a] < rank[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        if rank[root_a] == rank[root_b]:
+            rank[root_a] += 1
+        del rank[root_b]
+        return root_a
+
+    def update(self, edges):
+        '''
+        Union the endpoints of each (source, target) tuple in edges.
+        '''
+        union = self.union
+        for source, target in edges:
+            union(source, target)
+
+    def labels(self):
+        '''
+        Returns:
+            A dict mapping each node to the integer label of its component,
+            where labels are consecutive integers starting at 0.
+        '''
+        find = self.find
+        root_labels = {}
+        return {node: root_labels.setdefault(find(node), len(root_labels)) for node in self.parent}
+
+    def components(self):
+        '''
+        Returns:
+            A list of sets of nodes, which comprise a partition of all the nodes.
+        '''
+        find = self.find
+        root_components = {}
+        for node in self.parent:
+            root_components.setdefault(find(node), set()).add(node)
+        return list(root_components.values())
+
+
+def get_component_labels(edges):
+    '''
+    Find the connected components of the (undirected) graph described by edges,
+    in a single streaming pass, without building a graph_map(...) first.
+
+    Args:
+        edges: an iterable of tuples of (source, target), where source and
+            target are hashable values representing nodes.
+
+    Returns:
+        A dict mapping each node to the integer label of its component.
+    '''
+    components = DisjointSet()
+    components.update(edges)
+    return components.labels()
+
+
+class ComponentTracker(object):
+    '''
+    Maintain the connected components of a growing (undirected) graph as
+    batches of edges arrive, without re-running graph_map(...) and
+    get_all_components(...) on the cumulative graph. Each batch costs time
+    proportional to its own size (times the inverse Ackermann function).
+
+    Use like:
+
+        tracker = ComponentTracker()
+        for batch in edge_batches:
+            merges = tracker.add_edges(batch)
+            ...
+        tracker.same_component('a', 'b')
+    '''
+    def __init__(self, edges=()):
+        self.disjoint_set = DisjointSet()
+        self.sizes = {}
+        self.add_edges(edges)
+
+    def __len__(self):
+        '''
+        Returns the number of nodes seen so far.
+        '''
+        return len(self.disjoint_set)
+
+    def __contains__(self, node):
+        return node in self.disjoint_set
+
+    def _find(self, node):
+        if node not in self.disjoint_set:
+            self.sizes[node] = 1
+        return self.disjoint_set.find(node)
+
+    def add_edges(self, edges):
+        '''
+        Add a batch of (source, target) edges.
+
+        Returns:
+            A dict mapping the representative of each component that changed
+            in this batch to the set of representatives of the components
+            (including new singleton nodes) that were merged into it.
+        '''
+        find = self._find
+        union = self.disjoint_set.union
+        sizes = self.sizes
+        merges = {}
+        for source, target in edges:
+            root_a = find(source)
+            root_b = find(target)
+            if root_a == root_b:
+                continue
+            root = union(root_a, root_b)
+            absorbed = root_b if root == root_a else root_a
+            sizes[root] += sizes.pop(absorbed)
+            merged = merges.pop(absorbed, {absorbed})
+            merges.setdefault(root, {root}).update(merged)
+        return merges
+
+    def component_of(self, node):
+        '''
+        Returns the representative node of the component containing node.
+        Raises KeyError if node has not been seen.
+        '''
+        if node not in self.disjoint_set:
+            raise KeyError(node)
+        return self.disjoint_set.find(node)
+
+    def same_component(self, a, b):
+        '''
+        Returns True if a and b are connected. Nodes that have not been seen
+        are only connected to themselves.
+        '''
+        if a not in self.disjoint_set or b not in self.disjoint_set:
+            return a == b
+        return self.disjoint_set.find(a) == self.disjoint_set.find(b)
+
+    def component_size(self, node):
+        return self.sizes[self.component_of(node)]
+
+    def components(self):
+        return self.disjoint_set.components()
@@ -1,8 +1,206 @@
-def memoized_property(getter_function):
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+
+# sentinel for "not cached"
+_missing = object()
+
+
+class _InstanceTable(object):
+    '''
+    A mapping from instances (by identity, so they need not be hashable) to
+    values, which forgets each entry when its instance is garbage collected.
+    Nothing is stored on the instances themselves, so they can still be
+    pickled and copied.
+    '''
+    def __init__(self):
+        # maps id(instance) to (weakref to instance, value)
+        self.entries = {}
+
+    def get(self, instance, default=None):
+        entry = self.entries.get(id(instance))
+        if entry is None or entry[0]() is not instance:
+            return default
+        return entry[1]
+
+    def set(self, instance, value):
+        key = id(instance)
+        instance_ref = weakref.ref(instance, lambda ref: self._forget(key, ref))
+        self.entries[key] = (instance_ref, value)
+
+    def pop(self, instance):
+        if self.get(instance, _missing) is not _missing:
+            del self.entries[id(instance)]
+
+    def _forget(self, key, instance_ref):
+        # only if the id has not since been reused by another instance
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is instance_ref:
+            del self.entries[key]
+
+
+# per-instance locks, and the lock that guards their creation
+_instance_locks = _InstanceTable()
+_instance_locks_lock = threading.Lock()
+
+
+def _instance_lock(instance):
+    '''
+    Return the re-entrant lock for instance, creating it if needed. It's
+    re-entrant because one memoized property's getter often reads another
+    memoized property of the same instance.
+    '''
+    lock = _instance_locks.get(instance)
+    if lock is None:
+        with _instance_locks_lock:
+            lock = _instance_locks.get(instance)
+            if lock is None:
+                lock = threading.RLock()
+                _instance_locks.set(instance, lock)
+    return lock
+
+
+class MemoBudget(object):
+    '''
+    MemoBudget is a size-bounded, least-recently-used store shared by any
+    number of memoized properties, across all of their instances. When the
+    total size of the memoized values exceeds max_size, the least recently
+    used values are evicted (and will be recomputed on next access).
+
+    Sizes are measured with sizeof, which defaults to sys.getsizeof; note that
+    sys.getsizeof does not count the items of containers, so for, e.g., lists
+    of tokens, `len` might be a more useful measure (with max_size in items).
+
+    Use like:
+
+        budget = MemoBudget(2 ** 30)
+
+        class TextFile:
+            @memoized_property(budget=budget)
+            def text(self):
+                return open(self.filepath).read()
+    '''
+    def __init__(self, max_size, sizeof=sys.getsizeof):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        # re-entrant, since garbage collection (and so a weakref callback
+        # calling discard_key) can happen while the lock is held
+        self.lock = threading.RLock()
+        # maps (id(instance), key) to (weakref to instance, size)
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return '<MemoBudget({size}/{max_size} in {count} values)>'.format(
+            size=self.size, max_size=self.max_size, count=len(self.entries))
+
+    def add(self, instance, key, value):
+        entry_key = (id(instance), key)
+        size = self.sizeof(value)
+        with self.lock:
+            self._discard(entry_key)
+            # when the instance is garbage collected, forget its entries
+            instance_ref = weakref.ref(instance, lambda _: self.discard_key(entry_key))
+            self.entries[entry_key] = (instance_ref, size)
+            self.size += size
+            # evict least recently used values, but never the one just added
+            while self.size > self.max_size and len(self.entries) > 1:
+                (_, evicted_key), (evicted_ref, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                evicted_instance = evicted_ref()
+                if evicted_instance is not None:
+                    evicted_instance.__dict__.pop(evicted_key, None)
+
+    def touch(self, instance, key):
+        with self.lock:
+            entry_key = (id(instance), key)
+            if entry_key in self.entries:
+                self.entries.move_to_end(entry_key)
+
+    def _discard(self, entry_key):
+        entry = self.entries.pop(entry_key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def discard_key(self, entry_key):
+        with self.lock:
+            self._discard(entry_key)
+
+    def discard(self, instance, key):
+        self.discard_key((id(instance), key))
+
+
+class MemoizedProperty(object):
+    '''
+    The descriptor created by memoized_property; see memoized_property.
+    '''
+    def __init__(self, getter_function, weak=False, budget=None):
+        self.getter_function = getter_function
+        self.key = '__' + getter_function.__name__
+        self.weak = weak
+        self.budget = budget
+        # weak references to the values, if weak, kept off the instances
+        self.weak_values = _InstanceTable()
+        self.__name__ = getter_function.__name__
+        self.__doc__ = getter_function.__doc__
+
+    def _lookup(self, instance):
+        if not self.weak:
+            return instance.__dict__.get(self.key, _missing)
+        value_ref = self.weak_values.get(instance)
+        value = None if value_ref is None else value_ref()
+        return _missing if value is None else value
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self._lookup(instance)
+        if value is _missing:
+            with _instance_lock(instance):
+                # check again, in case another thread computed it while we waited
+                value = self._lookup(instance)
+                if value is _missing:
+                    value = self.getter_function(instance)
+                    if self.weak:
+                        self.weak_values.set(instance, weakref.ref(value))
+                    else:
+                        instance.__dict__[self.key] = value
+                    if self.budget is not None:
+                        self.budget.add(instance, self.key, value)
+                    return value
+        if self.budget is not None:
+            self.budget.touch(instance, self.key)
+        return value
+
+    def __set__(self, instance, value):
+        raise AttributeError("can't set attribute")
+
+    def __delete__(self, instance):
+        '''
+        Invalidate the memoized value, so that it is recomputed on next access.
+        '''
+        instance.__dict__.pop(self.key, None)
+        self.weak_values.pop(instance)
+        if self.budget is not None:
+            self.budget.discard(instance, self.key)
+
+
+def memoized_property(getter_function=None, weak=False, budget=None):
     '''
     This can be used in place of @property. It works much the same way,
     but caches the result of the @property call in self.__{propname}, where
-    {propname} is the value of the getter_function.func_name attribute.
+    {propname} is the value of the getter_function.__name__ attribute.
 
     Use like:
 
@@ -15,14 +213,274 @@ def memoized_property(getter_function):
             @memoized_property
             def text(self):
                 return open(self.filepath).read()
+
+    `del text_file.text` discards the cached value, so that it will be
+    recomputed on next access.
+
+    The first access is guarded by a per-instance lock, so concurrent first
+    accesses from several threads only call the getter once.
+
+    Options (use like `@memoized_property(budget=budget)`):
+
+        weak: if True, only hold a weak reference to the value, so that it's
+            recomputed if nothing else is using it (not all types support weak
+            references; in particular, str and list do not)
+        budget: a MemoBudget, which bounds the total size of the values it
+            tracks, evicting the least recently used ones
     '''
-    propname = '__' + getter_function.__name__
+    if getter_function is None:
+        return lambda getter_function: MemoizedProperty(getter_function, weak, budget)
+    return MemoizedProperty(getter_function, weak, budget)
 
-    def fget(self):
-        if hasattr(self, propname):
-            return getattr(self, propname)
-        value = getter_function(self)
-        setattr(self, propname, value)
+
+# function memoization
+
+def _update_hash(sha, obj):
+    '''
+    Feed obj into the hashlib object sha, such that equal values (including
+    unhashable ones like lists, dicts, and numpy arrays) produce equal digests,
+    in any process.
+    '''
+    # tag each value with its type so that, e.g., (1, 2) and [1, 2] differ
+    sha.update(type(obj).__qualname__.encode('utf-8'))
+    if isinstance(obj, (list, tuple)):
+        sha.update(str(len(obj)).encode('ascii'))
+        for item in obj:
+            _update_hash(sha, item)
+    elif isinstance(obj, dict):
+        sha.update(str(len(obj)).encode('ascii'))
+        for key_digest, value in sorted((_hash(key), value) for key, value in obj.items()):
+            sha.update(key_digest.encode('ascii'))
+            _update_hash(sha, value)
+    elif isinstance(obj, (set, frozenset)):
+        sha.update(''.join(sorted(_hash(item) for item in obj)).encode('ascii'))
+    elif hasattr(obj, '__array_interface__') and hasattr(obj, 'tobytes'):
+        # numpy arrays: hash the raw data rather than pickling it
+        sha.update(str(obj.dtype).encode('utf-8'))
+        sha.update(str(obj.shape).encode('ascii'))
+        if obj.dtype.hasobject:
+            _update_hash(sha, obj.tolist())
+        else:
+            # hash a byte view of the buffer; only non-contiguous arrays are copied
+            data = obj if obj.flags['C_CONTIGUOUS'] else obj.copy(order='C')
+            sha.update(memoryview(data.reshape(-1).view('u1')))
+    elif hasattr(obj, 'tocsr') and hasattr(obj, 'format'):
+        # scipy sparse matrices: hash the component arrays rather than pickling
+        if obj.format not in ('csr', 'csc', 'bsr', 'coo'):
+            obj = obj.tocsr()
+        sha.update(obj.format.encode('ascii'))
+        sha.update(str(obj.shape).encode('ascii'))
+        components = (obj.row, obj.col, obj.data) if obj.format == 'coo' else (obj.indptr, obj.indices, obj.data)
+        for component in components:
+            _update_hash(sha, component)
+    else:
+        sha.update(pickle.dumps(obj, protocol=4))
+
+
+def _hash(obj):
+    sha = hashlib.sha1()
+    _update_hash(sha, obj)
+    return sha.hexdigest()
+
+
+def hash_arguments(function, args, kwargs):
+    '''
+    Return a hex digest identifying a call of function with args and kwargs.
+    '''
+    return _hash((function.__module__, function.__qualname__, args, kwargs))
+
+
+class MemoryStore(object):
+    '''
+    An in-memory, least-recently-used store for memoized, with at most maxsize
+    entries (or unbounded, if maxsize is None).
+    '''
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self.lock = threading.Lock()
+        # maps keys to (value, stored_at) tuples
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        '''
+        Return (value, stored_at) for key, or raise KeyError.
+        '''
+        with self.lock:
+            entry = self.entries[key]
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at):
+        with self.lock:
+            self.entries[key] = (value, stored_at)
+            self.entries.move_to_end(key)
+            while self.maxsize is not None and len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DirectoryStore(object):
+    '''
+    A store for memoized that pickles each entry into its own file in
+    directory, so that it persists across processes. Files are written to a
+    temporary name and then renamed into place, so a concurrent reader never
+    sees a partial entry.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return sum(1 for filename in os.listdir(self.directory) if filename.endswith('.pickle'))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as fp:
+                return pickle.load(fp)
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def set(self, key, value, stored_at):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump((value, stored_at), fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.pickle'):
+                os.unlink(os.path.join(self.directory, filename))
+
+
+class SqliteStore(object):
+    '''
+    A store for memoized that keeps pickled entries in a single sqlite
+    database file, so that it persists across processes. Each write is its own
+    (atomic) transaction.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS memo (key TEXT PRIMARY KEY, value BLOB, stored_at REAL)')
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM memo').fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute('SELECT value, stored_at FROM memo WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0]), row[1]
+
+    def set(self, key, value, stored_at):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO memo VALUES (?, ?, ?)', (key, data, stored_at))
+
+    def delete(self, key):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM memo WHERE key = ?', (key,))
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM memo')
+
+
+CacheStats = namedtuple('CacheStats', ['hits', 'misses', 'evictions', 'size'])
+
+
+def memoized(function=None, maxsize=128, ttl=None, store=None):
+    '''
+    Cache the results of calls to function, keyed by a hash of its arguments
+    (see hash_arguments), which, unlike functools.lru_cache, supports
+    unhashable arguments like lists, dicts, and numpy arrays.
+
+    Use like:
+
+        @memoized
+        def fit(X, y):
+            ...
+
+        @memoized(ttl=3600, store=SqliteStore('fits.sqlite'))
+        def fit(X, y):
+            ...
+
+    Options:
+
+        maxsize: the maximum number of entries kept by the default
+            MemoryStore, evicting the least recently used (None for no limit)
+        ttl: if given, entries older than ttl seconds are treated as misses
+            (and deleted)
+        store: where to keep entries, if not in memory: a DirectoryStore or
+            SqliteStore (or anything with the same get/set/delete/clear
+            methods), which persist across processes
+
+    The wrapper has cache_stats() and cache_clear() methods, like lru_cache's
+    cache_info() and cache_clear(); evictions count both LRU evictions and
+    expired entries.
+    '''
+    if function is None:
+        return functools.partial(memoized, maxsize=maxsize, ttl=ttl, store=store)
+    if store is None:
+        store = MemoryStore(maxsize)
+    stats = dict(hits=0, misses=0, expirations=0)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        key = hash_arguments(function, args, kwargs)
+        try:
+            value, stored_at = store.get(key)
+        except KeyError:
+            pass
+        else:
+            if ttl is None or time.time() - stored_at <= ttl:
+                stats['hits'] += 1
+                return value
+            store.delete(key)
+            stats['expirations'] += 1
+        stats['misses'] += 1
+        value = function(*args, **kwargs)
+        store.set(key, value, time.time())
         return value
 
-    return property(fget, doc=getter_function.__doc__)
+    def cache_stats():
+        evictions = stats['expirations'] + getattr(store, 'evictions', 0)
+        return CacheStats(stats['hits'], stats['misses'], evictions, len(store))
+
+    def cache_clear():
+        store.clear()
+
+    wrapper.cache_stats = cache_stats
+    wrapper.cache_clear = cache_clear
+    wrapper.store = store
+    return wrapper
@@ -0,0 +1,224 @@
+import numbers
+import zlib
+from collections import defaultdict
+from itertools import combinations
+
+import numpy as np
+
+# hash values are computed modulo this (Mersenne) prime, which is small enough
+# that a * value + b never overflows a uint64
+_prime = np.uint64((1 << 31) - 1)
+
+# the number of set elements hashed at once by MinHasher.hashvalues
+_block_size = 1024
+
+
+def _token_hashes(tokens):
+    '''
+    Map tokens to integers in [0, 2^31 - 1), consistently across processes
+    (unlike the built-in hash()). Integers of any type (e.g., interned
+    vocabulary ids, whether Python ints or numpy integers) are reduced modulo
+    p; anything else is hashed as a string with CRC-32.
+    '''
+    if isinstance(tokens, np.ndarray) and tokens.dtype.kind == 'u':
+        return tokens.astype(np.uint64) % _prime
+    if isinstance(tokens, np.ndarray) and tokens.dtype.kind == 'i':
+        # reduce while signed, so negative ids wrap like Python ints do
+        return (tokens.astype(np.int64) % np.int64(_prime)).astype(np.uint64)
+    prime = int(_prime)
+    return np.fromiter((token % prime if isinstance(token, numbers.Integral)
+                        else zlib.crc32(str(token).encode('utf-8')) % prime
+                        for token in tokens), dtype=np.uint64)
+
+
+class MinHash(object):
+    '''
+    A MinHash signature of a set: for each of num_perm random hash functions,
+    the minimum hash value over the set's elements. The fraction of positions
+    at which two signatures agree is an unbiased estimate of the Jaccard
+    similarity of the two sets (see pycommon.jaccard).
+    '''
+    def __init__(self, hashvalues):
+        self.hashvalues = hashvalues
+
+    def __len__(self):
+        return len(self.hashvalues)
+
+    def __repr__(self):
+        return '<MinHash({num_perm} permutations)>'.format(num_perm=len(self.hashvalues))
+
+    def jaccard(self, other):
+        '''
+        Estimate the Jaccard similarity of the sets that self and other were
+        computed from.
+        '''
+        if len(self) != len(other):
+            raise ValueError('Cannot compare MinHash signatures with different numbers of permutations')
+        return float(np.mean(self.hashvalues == other.hashvalues))
+
+
+class MinHasher(object):
+    '''
+    MinHasher computes MinHash signatures with num_perm universal hash
+    functions of the form (a * x + b) mod p, all evaluated at once, for a
+    block of a set's elements at a time, with numpy broadcasting.
+
+    Signatures are only comparable if they come from MinHashers with the same
+    num_perm and seed.
+    '''
+    def __init__(self, num_perm=128, seed=1):
+        self.num_perm = num_perm
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _prime, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _prime, size=num_perm, dtype=np.uint64)
+
+    def hashvalues(self, tokens):
+        '''
+        Return the array of num_perm minimum hash values of the set of tokens;
+        an empty set gets all p's (larger than any actual hash value).
+        '''
+        values = np.unique(_token_hashes(tokens))
+        hashvalues = np.full(self.num_perm, _prime, dtype=np.uint64)
+        a = self.a[:, None]
+        b = self.b[:, None]
+        # hash blocks of values at a time, so the num_perm x block temporaries
+        # stay small even for very large sets
+        for start in range(0, len(values), _block_size):
+            block = np.multiply(a, values[start:start + _block_size])
+            block += b
+            block %= _prime
+            np.minimum(hashvalues, block.min(axis=1), out=hashvalues)
+        return hashvalues
+
+    def minhash(self, tokens):
+        return MinHash(self.hashvalues(tokens))
+
+    def signatures(self, token_sets):
+        '''
+        Return a (len(token_sets), num_perm) array of hash values, one row per
+        set of tokens.
+        '''
+        signatures = np.empty((len(token_sets), self.num_perm), dtype=np.uint64)
+        for i, tokens in enumerate(token_sets):
+            signatures[i] = self.hashvalues(tokens)
+        return signatures
+
+
+def _optimal_bands(num_perm, threshold):
+    '''
+    Return the (bands, rows) with bands * rows <= num_perm whose S-curve
+    threshold, (1 / bands) ** (1 / rows), is closest to threshold.
+    '''
+    candidates = ((bands, num_perm // bands) for bands in range(1, num_perm + 1))
+    return min(candidates, key=lambda band_rows: abs((1 / band_rows[0]) ** (1 / band_rows[1]) - threshold))
+
+
+class LSHIndex(object):
+    '''
+    A locality-sensitive hashing index over MinHash signatures, using the
+    banding technique: each signature is split into `bands` bands of `rows`
+    hash values, and two signatures become candidates if they agree on every
+    value of at least one band. The bands and rows are chosen so that pairs
+    with a Jaccard similarity around threshold have about even odds of
+    becoming candidates; higher similarities are very likely to, and lower
+    ones very unlikely to.
+
+    Use like:
+
+        hasher = MinHasher()
+        index = LSHIndex(threshold=0.8, num_perm=hasher.num_perm)
+        for key, tokens in documents.items():
+            index.insert(key, hasher.minhash(tokens))
+        index.candidate_pairs()
+    '''
+    def __init__(self, threshold=0.5, num_perm=128):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = _optimal_bands(num_perm, threshold)
+        self.buckets = [defaultdict(list) for _ in range(self.bands)]
+        self.keys = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _band_keys(self, hashvalues):
+        rows = self.rows
+        return [hashvalues[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def insert(self, key, minhash):
+        '''
+        Add minhash (a MinHash or an array of hash values) under key.
+        '''
+        hashvalues = getattr(minhash, 'hashvalues', minhash)
+        for buckets, band_key in zip(self.buckets, self._band_keys(hashvalues)):
+            buckets[band_key].append(key)
+        self.keys.append(key)
+
+    def query(self, minhash):
+        '''
+        Return the set of keys that share at least one band with minhash.
+        '''
+        hashvalues = getattr(minhash, 'hashvalues', minhash)
+        candidates = set()
+        for buckets, band_key in zip(self.buckets, self._band_keys(hashvalues)):
+            candidates.update(buckets.get(band_key, ()))
+        return candidates
+
+    def candidate_pairs(self):
+        '''
+        Return the set of all pairs of keys (ordered by insertion) that share at
+        least one band.
+        '''
+        order = {key: i for i, key in enumerate(self.keys)}
+        pairs = set()
+        for buckets in self.buckets:
+            for bucket in buckets.values():
+                if len(bucket) > 1:
+                    pairs.update(combinations(sorted(bucket, key=order.__getitem__), 2))
+        return pairs
+
+
+def jaccard_many(id_sets, pairs):
+    '''
+    Compute the exact Jaccard similarities of many pairs of sets of integer
+    ids (e.g., interned vocabulary ids, like TextCorpus.token_id_set), which
+    are each converted to a sorted numpy array once, and then intersected with
+    numpy's sorted-array operations rather than by building Python sets.
+
+    Args:
+        id_sets: a sequence of iterables of integers
+        pairs: an iterable of (i, j) index pairs into id_sets
+
+    Returns:
+        A numpy array of similarities, one per pair; two empty sets have a
+        similarity of 0.
+    '''
+    arrays = [np.unique(np.fromiter(id_set, dtype=np.int64)) for id_set in id_sets]
+    similarities = []
+    for i, j in pairs:
+        intersection = len(np.intersect1d(arrays[i], arrays[j], assume_unique=True))
+        union = len(arrays[i]) + len(arrays[j]) - intersection
+        similarities.append(intersection / union if union else 0.0)
+    return np.array(similarities, dtype=float)
+
+
+def similar_pairs(id_sets, threshold, num_perm=128, seed=1):
+    '''
+    Find all pairs of sets (of integer ids) in id_sets with a Jaccard
+    similarity of at least threshold, without comparing every pair: MinHash
+    signatures are indexed with an LSHIndex to find candidate pairs, which are
+    then verified exactly with jaccard_many. Very rarely, a pair above the
+    threshold may be missed.
+
+    Returns:
+        A list of (i, j, similarity) tuples, with i < j.
+    '''
+    id_sets = list(id_sets)
+    hasher = MinHasher(num_perm, seed)
+    index = LSHIndex(threshold, num_perm)
+    for i, hashvalues in enumerate(hasher.signatures(id_sets)):
+        index.insert(i, hashvalues)
+    candidates = sorted(index.candidate_pairs())
+    similarities = jaccard_many(id_sets, candidates)
+    return [(i, j, similarity) for (i, j), similarity in zip(candidates, similarities) if similarity >= threshold]
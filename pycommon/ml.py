@@ -1,8 +1,224 @@
+import os
+import tempfile
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+
 import numpy as np
-from sklearn import cross_validation
+import scipy.sparse
+
+
+def _as_indices(indices):
+    '''
+    Convert a list of indices or a boolean mask to an array of integer indices.
+    '''
+    indices = np.asarray(indices)
+    if indices.dtype == bool:
+        return np.flatnonzero(indices)
+    return indices.astype(np.intp, copy=False)
+
+
+def _checked_indices(indices, length):
+    '''
+    Like _as_indices, but raise an IndexError if any index is out of bounds
+    for a sequence of the given length, and convert negative indices to
+    positive ones.
+    '''
+    indices = _as_indices(indices)
+    if len(indices) and (indices.min() < -length or indices.max() >= length):
+        raise IndexError('index out of bounds for axis 0 with size %d' % length)
+    if len(indices) and indices.min() < 0:
+        indices = np.where(indices < 0, indices + length, indices)
+    return indices
+
+
+def cache_folds(folds):
+    '''
+    Evaluate an iterable of (train_indices, test_indices) folds (e.g., from
+    iter_folds) into a list of pairs of integer index arrays, converting
+    boolean masks as needed. The result can be replayed across many models
+    without regenerating (or re-converting) the splits.
+    '''
+    return [(_as_indices(train_indices), _as_indices(test_indices)) for train_indices, test_indices in folds]
+
+
+def _resolve_size(size, n_samples):
+    '''
+    Interpret size as a fraction of n_samples if it's a float, or as an
+    absolute number of samples if it's an int.
+    '''
+    if isinstance(size, float):
+        return int(np.floor(size * n_samples))
+    return int(size)
+
+
+class PermutationSplit(object):
+    '''
+    A drop-in replacement for sklearn.model_selection.ShuffleSplit, which
+    generates the permutations for all n_iter splits with a single batched
+    call to numpy's random number generator.
+
+    train_size and test_size can each be a float (a proportion of the data) or
+    an int (a number of samples); when test_size is None, the complement of
+    train_size is used, as with the old sklearn.cross_validation.ShuffleSplit.
+    '''
+    def __init__(self, n_iter=10, train_size=0.9, test_size=None, random_state=None):
+        self.n_iter = n_iter
+        self.train_size = train_size
+        self.test_size = test_size
+        self.random_state = random_state
+
+    def get_n_splits(self, X=None, y=None, groups=None):
+        return self.n_iter
+
+    def split(self, X, y=None, groups=None):
+        n_samples = X.shape[0] if hasattr(X, 'shape') else len(X)
+        n_train = _resolve_size(self.train_size, n_samples)
+        n_test = n_samples - n_train if self.test_size is None else _resolve_size(self.test_size, n_samples)
+        if n_train + n_test > n_samples:
+            raise ValueError('train_size + test_size ({} + {}) exceeds the number of samples ({})'.format(
+                n_train, n_test, n_samples))
+        rng = np.random.default_rng(self.random_state)
+        # one (n_iter, n_samples) matrix of permutations, one row per split,
+        # shuffled in place
+        permutations = np.empty((self.n_iter, n_samples), dtype=np.intp)
+        permutations[:] = np.arange(n_samples)
+        rng.permuted(permutations, axis=1, out=permutations)
+        for permutation in permutations:
+            yield permutation[:n_train], permutation[n_train:n_train + n_test]
+
+
+def _splitter_for(splitter, train_size):
+    '''
+    Return splitter itself, or, if it's a function (rather than a splitter or
+    a sequence of folds), the splitter it returns for train_size.
+    '''
+    if callable(splitter) and not hasattr(splitter, 'split'):
+        return splitter(train_size)
+    return splitter
+
+
+def iter_folds(splitter, X, y):
+    '''
+    Return an iterable of (train_indices, test_indices) pairs from splitter,
+    which can be:
+
+    * any sklearn.model_selection-style splitter with a split(X, y) method,
+      e.g., ShuffleSplit, StratifiedShuffleSplit, KFold, or PermutationSplit
+    * a pre-generated sequence of (train_indices, test_indices) pairs
+    '''
+    if hasattr(splitter, 'split'):
+        return splitter.split(X, y)
+    return splitter
+
+
+# the number of rows FoldMaterializer gathers from a CSR matrix at once
+_csr_block_rows = 8192
 
 
-def train_test_predictions(X, y, train_indices, test_indices, model):
+class FoldMaterializer(object):
+    '''
+    FoldMaterializer gathers the rows of X and y for a fold into buffers that
+    are reused from one fold to the next, rather than allocating fresh copies
+    with fancy indexing on every fold, which keeps peak memory flat across
+    folds.
+
+    X can be a dense numpy array (including a np.memmap, from which only the
+    requested rows are read) or a scipy sparse matrix (converted to CSR once,
+    if necessary, and then gathered a block of rows at a time into reused
+    data/indices buffers). Anything else falls back to plain fancy indexing.
+
+    There is one set of buffers per role (e.g., 'train' and 'test'), and the
+    arrays returned by take() for a role are only valid until the next call
+    to take() for that role.
+    '''
+    def __init__(self, X, y):
+        if scipy.sparse.issparse(X) and X.format != 'csr':
+            X = X.tocsr()
+        self.X = X
+        self.y = np.asarray(y)
+        self._buffers = {}
+
+    def _buffer(self, name, length, template):
+        '''
+        Return the first `length` rows of the buffer called `name`, which has
+        the trailing shape and dtype of template, (re)allocating it if needed.
+        '''
+        buffer = self._buffers.get(name)
+        if buffer is None or len(buffer) < length:
+            buffer = self._buffers[name] = np.empty((length,) + template.shape[1:], dtype=template.dtype)
+        return buffer[:length]
+
+    def _take_csr(self, indices, role):
+        X = self.X
+        starts = X.indptr[indices]
+        ends = X.indptr[indices + 1]
+        indptr = self._buffer(role + '_indptr', len(indices) + 1, X.indptr)
+        indptr[0] = 0
+        np.cumsum(ends - starts, out=indptr[1:])
+        nnz = indptr[-1]
+        data = self._buffer(role + '_data', nnz, X.data)
+        column_indices = self._buffer(role + '_indices', nnz, X.indices)
+        # gather the nonzeros of a block of rows at a time, so the position
+        # temporaries are proportional to the block, not to nnz
+        for block in range(0, len(indices), _csr_block_rows):
+            block_starts = starts[block:block + _csr_block_rows]
+            block_indptr = indptr[block:block + _csr_block_rows + 1]
+            lengths = np.diff(block_indptr)
+            begin, end = block_indptr[0], block_indptr[-1]
+            positions = np.repeat(block_starts - (block_indptr[:-1] - begin), lengths)
+            positions += np.arange(end - begin)
+            # positions are in bounds by construction, and mode='wrap' avoids buffering
+            np.take(X.data, positions, out=data[begin:end], mode='wrap')
+            np.take(X.indices, positions, out=column_indices[begin:end], mode='wrap')
+        return scipy.sparse.csr_matrix((data, column_indices, indptr), shape=(len(indices), X.shape[1]), copy=False)
+
+    def take_X(self, indices, role):
+        indices = _checked_indices(indices, self.X.shape[0])
+        if scipy.sparse.issparse(self.X):
+            return self._take_csr(indices, role)
+        if isinstance(self.X, np.ndarray):
+            # mode='raise' (the default) would write into a temporary first
+            return np.take(self.X, indices, axis=0, out=self._buffer(role + '_X', len(indices), self.X), mode='wrap')
+        return self.X[indices, :]
+
+    def take_y(self, indices, role):
+        indices = _checked_indices(indices, len(self.y))
+        return np.take(self.y, indices, out=self._buffer(role + '_y', len(indices), self.y), mode='wrap')
+
+    def take(self, indices, role):
+        '''
+        Return (X rows, y values) for indices (a list of indices or a boolean
+        mask), written into the buffers for role.
+        '''
+        return self.take_X(indices, role), self.take_y(indices, role)
+
+
+def _predict(model, test_X):
+    '''
+    Return a tuple of (pred_y, pred_y_proba): the model's top prediction for
+    each row of test_X, and the probability it assigned to that prediction.
+    '''
+    pred_proba = model.predict_proba(test_X)
+    pred_proba_argmax = pred_proba.argmax(axis=1)
+    # this has the same effect as: pred_y = model.predict(test_X)
+    pred_y = model.classes_[pred_proba_argmax]
+    # we must use np.arange(pred_proba.shape[0]), not :, to select all the rows
+    pred_y_proba = pred_proba[np.arange(pred_proba.shape[0]), pred_proba_argmax]
+    return pred_y, pred_y_proba
+
+
+def _fit(X, y, train_indices, model, materializer=None):
+    if materializer is None:
+        train_X = X[train_indices, :]
+        train_y = y[train_indices]
+    else:
+        train_X, train_y = materializer.take(train_indices, 'train')
+    model.fit(train_X, train_y)
+
+
+def train_test_predictions(X, y, train_indices, test_indices, model, materializer=None):
     '''
     Train a model on the given train/test split, and return predictions on the
     test data (and probabilities of the top prediction).
@@ -13,29 +229,157 @@ def train_test_predictions(X, y, train_indices, test_indices, model):
     test_indices is either a list of indices or a boolean mask
     model is a parameterized scikit-learn model, e.g.,
         model = linear_model.LogisticRegression(penalty='l2')
+    materializer is an optional FoldMaterializer over X and y, which is used to
+        gather the train/test rows into reused buffers
 
     Return a tuple of (test_y, pred_y, pred_y_proba), so that you can easily
     get the accuracy by calling (test_y == pred_y).mean()
     '''
-    # divide data
-    train_X = X[train_indices, :]
-    train_y = y[train_indices]
-    test_X = X[test_indices, :]
-    test_y = y[test_indices]
     # fit model
-    model.fit(train_X, train_y)
+    _fit(X, y, train_indices, model, materializer)
+    if materializer is None:
+        test_X = X[test_indices, :]
+    else:
+        test_X = materializer.take_X(test_indices, 'test')
+    # test_y is returned, so it must not share a reused buffer
+    test_y = y[test_indices]
     # predict on test data
-    pred_proba = model.predict_proba(test_X)
-    pred_proba_argmax = pred_proba.argmax(axis=1)
-    # this has the same effect as: pred_y = model.predict(test_X)
-    pred_y = model.classes_[pred_proba_argmax]
-    # we must use np.arange(pred_proba.shape[0]), not :, to select all the rows
-    pred_y_proba = pred_proba[np.arange(pred_proba.shape[0]), pred_proba_argmax]
+    pred_y, pred_y_proba = _predict(model, test_X)
     # return tuple of predictions
     return test_y, pred_y, pred_y_proba
 
 
-def train_test_predictions_iter(X, y, train_size, n_iter, Model):
+# parallel execution of folds
+
+_NpyRef = namedtuple('_NpyRef', ['path'])
+_CSRRef = namedtuple('_CSRRef', ['data', 'indices', 'indptr', 'shape'])
+
+
+def _save_array(array, directory, name):
+    path = os.path.join(directory, name + '.npy')
+    np.save(path, array)
+    return path
+
+
+def _share(array, directory, name):
+    '''
+    Write array to disk in directory and return a small, picklable reference
+    to it that worker processes can memory-map (see _load), so that it is
+    never pickled in full. Dense numpy arrays and CSR matrices are supported;
+    anything else is returned as-is.
+    '''
+    if isinstance(array, np.ndarray) and not array.dtype.hasobject:
+        return _NpyRef(_save_array(array, directory, name))
+    if scipy.sparse.issparse(array) and array.format == 'csr':
+        return _CSRRef(_save_array(array.data, directory, name + '_data'),
+                       _save_array(array.indices, directory, name + '_indices'),
+                       _save_array(array.indptr, directory, name + '_indptr'),
+                       array.shape)
+    return array
+
+
+def _load(ref):
+    '''
+    The inverse of _share: memory-map the referenced array(s) read-only.
+    '''
+    if isinstance(ref, _NpyRef):
+        return np.load(ref.path, mmap_mode='r')
+    if isinstance(ref, _CSRRef):
+        data, indices, indptr = (np.load(path, mmap_mode='r') for path in ref[:3])
+        return scipy.sparse.csr_matrix((data, indices, indptr), shape=ref.shape)
+    return ref
+
+
+# the (X, y, Model) of the current worker process, set by _init_worker
+_worker_state = {}
+
+
+def _init_worker(X_ref, y_ref, Model):
+    X, y = _load(X_ref), _load(y_ref)
+    _worker_state.update(X=X, y=y, Model=Model, materializer=FoldMaterializer(X, y))
+
+
+def _run_fold_in_worker(fold_function, train_indices, test_indices):
+    X, y, Model = _worker_state['X'], _worker_state['y'], _worker_state['Model']
+    return fold_function(X, y, train_indices, test_indices, Model(), _worker_state['materializer'])
+
+
+def _run_fold(fold_function, X, y, train_indices, test_indices, Model):
+    # FoldMaterializer buffers are not thread-safe, so executors go without
+    return fold_function(X, y, train_indices, test_indices, Model())
+
+
+def _iter_indices(folds):
+    '''
+    Like cache_folds, but converts the folds lazily, one at a time.
+    '''
+    for train_indices, test_indices in folds:
+        yield _as_indices(train_indices), _as_indices(test_indices)
+
+
+def _submit_bounded(submit, folds, window):
+    '''
+    Call submit(train_indices, test_indices) for each fold, keeping at most
+    `window` futures in flight, and yield (fold, result) pairs in order. Folds
+    are drawn only as results are consumed; if the caller stops early, the
+    futures that have not started are cancelled.
+    '''
+    folds = iter(folds)
+    pending = deque((fold, submit(*fold)) for fold in islice(folds, window))
+    try:
+        while pending:
+            fold, future = pending.popleft()
+            # refill the window before handing the result back to the caller
+            for next_fold in islice(folds, 1):
+                pending.append((next_fold, submit(*next_fold)))
+            yield fold, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def _map_folds(fold_function, X, y, folds, Model, n_jobs=None, executor=None):
+    '''
+    Call fold_function(X, y, train_indices, test_indices, Model()) for each
+    (train_indices, test_indices) in folds, yielding (fold, result) pairs in
+    order, where each fold's indices have been converted with _as_indices.
+
+    Folds are drawn from the (possibly lazy) folds iterable one at a time, as
+    results are consumed, rather than all up front.
+
+    If n_jobs is greater than 1, the folds are run in a pool of that many
+    processes, with at most 2 * n_jobs folds submitted at once. X and y are
+    written to a temporary directory once and memory-mapped by each worker,
+    rather than pickled for each fold; Model must be picklable unless the
+    platform starts processes by forking.
+
+    Alternatively, executor can be any concurrent.futures.Executor, which is
+    used as-is (with at most 2 * n_jobs, or 2 * os.cpu_count(), folds
+    submitted at once); X, y and Model are passed with every fold, which is
+    free for a ThreadPoolExecutor but means pickling for other kinds of
+    executors.
+    '''
+    folds = _iter_indices(folds)
+    if executor is not None:
+        def submit(train_indices, test_indices):
+            return executor.submit(_run_fold, fold_function, X, y, train_indices, test_indices, Model)
+        yield from _submit_bounded(submit, folds, 2 * (n_jobs or os.cpu_count() or 1))
+    elif n_jobs is None or n_jobs == 1:
+        materializer = FoldMaterializer(X, y)
+        for train_indices, test_indices in folds:
+            result = fold_function(X, y, train_indices, test_indices, Model(), materializer)
+            yield (train_indices, test_indices), result
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            initargs = (_share(X, directory, 'X'), _share(y, directory, 'y'), Model)
+            with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=initargs) as pool:
+                def submit(train_indices, test_indices):
+                    return pool.submit(_run_fold_in_worker, fold_function, train_indices, test_indices)
+                yield from _submit_bounded(submit, folds, 2 * n_jobs)
+
+
+def train_test_predictions_iter(X, y, train_size, n_iter, Model, n_jobs=None, executor=None, splitter=None,
+                                columnar=False):
     '''
     Run train_test_predictions() n_iter times.
 
@@ -46,38 +390,226 @@ def train_test_predictions_iter(X, y, train_size, n_iter, Model):
     Example:
         df = pd.DataFrame(train_test_predictions_iter(X, y, 0.9, 10, Model))
 
-    Uses cross_validation.ShuffleSplit to pick random indices.
+    Uses PermutationSplit to pick random indices, unless splitter is given, in
+    which case n_iter is ignored. splitter can be a splitter (see iter_folds),
+    or a function from a train size to a splitter, which is called with
+    train_size, e.g.:
+
+        splitter = model_selection.StratifiedShuffleSplit(10, train_size=0.9)
+        df = pd.DataFrame(train_test_predictions_iter(X, y, None, None, Model, splitter=splitter))
+
+    Set n_jobs to fit the folds in parallel processes, or pass an executor;
+    see _map_folds. Predictions are still yielded in fold order.
+
+    If columnar is True, yield one dict of arrays per fold, with the same keys,
+    rather than one dict per test row, which is much faster for large test
+    sets; e.g.:
+
+        df = pd.concat(map(pd.DataFrame, train_test_predictions_iter(X, y, 0.9, 10, Model, columnar=True)))
     '''
-    # when test_size is None, the complement of train_size will be used.
-    folds = cross_validation.ShuffleSplit(len(y), n_iter=n_iter, train_size=train_size, test_size=None)
-    for i, (train_indices, test_indices) in enumerate(folds):
+    if splitter is None:
+        # the complement of train_size will be used as the test set
+        splitter = PermutationSplit(n_iter, train_size=train_size)
+    folds = iter_folds(_splitter_for(splitter, train_size), X, y)
+    results = _map_folds(train_test_predictions, X, y, folds, Model, n_jobs, executor)
+    for i, ((train_indices, test_indices), (test_y, pred_y, pred_y_proba)) in enumerate(results):
         fold_info = dict(train_size=len(train_indices), test_size=len(test_indices), iteration=i)
-        model = Model()
-        test_y, pred_y, pred_y_proba = train_test_predictions(X, y, train_indices, test_indices, model)
+        if columnar:
+            yield dict(test_label=test_y, pred_label=pred_y, pred_label_proba=pred_y_proba,
+                       **{key: np.full(len(test_y), value) for key, value in fold_info.items()})
+            continue
         for test_label, pred_label, pred_label_proba in zip(test_y, pred_y, pred_y_proba):
             yield dict(test_label=test_label, pred_label=pred_label, pred_label_proba=pred_label_proba, **fold_info)
 
 
-def train_test_report(X, y, train_indices, test_indices, model):
+# streaming metrics
+
+class RunningStats(object):
+    '''
+    Accumulate the count, mean, and variance of a stream of numbers, one batch
+    at a time, in constant memory, using Welford's algorithm generalized to
+    batches (Chan et al.'s parallel update). Two RunningStats can be combined
+    with merge().
+    '''
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def update(self, values, where=None):
+        '''
+        Add a batch of values (optionally, only those selected by the boolean
+        mask `where`, without copying them out). Returns self.
+        '''
+        values = np.asarray(values, dtype=float)
+        count = values.size if where is None else int(np.count_nonzero(where))
+        if count > 0:
+            where = True if where is None else where
+            mean = values.sum(where=where) / count
+            m2 = np.square(values - mean).sum(where=where)
+            self._combine(count, mean, m2)
+        return self
+
+    def merge(self, other):
+        if other.count > 0:
+            self._combine(other.count, other.mean, other.m2)
+        return self
+
+    @property
+    def variance(self):
+        '''
+        Population variance (like np.var), or nan if no values have been added.
+        '''
+        return self.m2 / self.count if self.count else float('nan')
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class FoldMetrics(object):
+    '''
+    Accumulate the metrics for train_test_report from batches of predictions:
+    accuracy, the mean and std. dev. of the probabilities of the correct and
+    incorrect predictions, and a Counter of (test label, predicted label)
+    confusion counts.
+    '''
+    def __init__(self):
+        self.correct_proba = RunningStats()
+        self.error_proba = RunningStats()
+        self.confusion = Counter()
+
+    def update(self, test_y, pred_y, pred_y_proba):
+        '''
+        Add a batch of predictions, as returned by train_test_predictions.
+        Returns self.
+        '''
+        correct = test_y == pred_y
+        self.correct_proba.update(pred_y_proba, where=correct)
+        self.error_proba.update(pred_y_proba, where=~correct)
+        # count (test, pred) pairs with a bincount over label codes
+        labels, codes = np.unique(np.concatenate([test_y, pred_y]), return_inverse=True)
+        pair_codes = codes[:len(test_y)] * len(labels) + codes[len(test_y):]
+        pair_counts = np.bincount(pair_codes, minlength=len(labels) ** 2)
+        for pair_code in np.flatnonzero(pair_counts):
+            test_code, pred_code = divmod(pair_code, len(labels))
+            self.confusion[labels[test_code], labels[pred_code]] += int(pair_counts[pair_code])
+        return self
+
+    def merge(self, other):
+        self.correct_proba.merge(other.correct_proba)
+        self.error_proba.merge(other.error_proba)
+        self.confusion.update(other.confusion)
+        return self
+
+    @property
+    def count(self):
+        return self.correct_proba.count + self.error_proba.count
+
+    def report(self):
+        '''
+        Return a dict like train_test_report's.
+        '''
+        accuracy = self.correct_proba.count / self.count if self.count else float('nan')
+        return dict(accuracy=accuracy,
+                    error_proba_mean=self.error_proba.mean if self.error_proba.count else float('nan'),
+                    error_proba_std=self.error_proba.std,
+                    correct_proba_mean=self.correct_proba.mean if self.correct_proba.count else float('nan'),
+                    correct_proba_std=self.correct_proba.std)
+
+
+def train_test_report(X, y, train_indices, test_indices, model, materializer=None, batch_size=None):
     '''
     Run train_test_predictions on the specified train/test split with the given
     model. Return a dict with the overall accuracy and mean and std. dev. on
     the probabilities assigned to the correct predictions and also for the
     incorrect predictions.
+
+    If batch_size is given, predict on the test data batch_size rows at a
+    time, accumulating the metrics with FoldMetrics, so that the full arrays of
+    predictions are never held in memory at once.
     '''
-    test_y, pred_y, pred_y_proba = train_test_predictions(X, y, train_indices, test_indices, model)
-    # correct_indices is a boolean mask
-    correct_indices = test_y == pred_y
-    accuracy = (correct_indices).mean()
-    error_proba = pred_y_proba[~correct_indices]
-    correct_proba = pred_y_proba[correct_indices]
-    # create report
-    return dict(accuracy=accuracy,
-                error_proba_mean=error_proba.mean(), error_proba_std=error_proba.std(),
-                correct_proba_mean=correct_proba.mean(), correct_proba_std=correct_proba.std())
+    if batch_size is None:
+        test_y, pred_y, pred_y_proba = train_test_predictions(X, y, train_indices, test_indices, model, materializer)
+        return FoldMetrics().update(test_y, pred_y, pred_y_proba).report()
+    _fit(X, y, train_indices, model, materializer)
+    test_indices = _as_indices(test_indices)
+    metrics = FoldMetrics()
+    for start in range(0, len(test_indices), batch_size):
+        batch_indices = test_indices[start:start + batch_size]
+        if materializer is None:
+            batch_X = X[batch_indices, :]
+        else:
+            batch_X = materializer.take_X(batch_indices, 'test')
+        pred_y, pred_y_proba = _predict(model, batch_X)
+        metrics.update(y[batch_indices], pred_y, pred_y_proba)
+    return metrics.report()
 
 
-def train_test_report_iter(X, y, train_sizes, n_iter, Model):
+def train_test_learning_curve(X, y, train_indices, test_indices, model, materializer=None, train_sizes=()):
+    '''
+    Fit model on nested prefixes of train_indices, one for each of the
+    (ascending) train_sizes, and evaluate each fit on the same test set.
+    Return a list of train_test_report-style dicts, one per train size, which
+    also include the train and test size.
+
+    Rather than fitting from scratch at each size, this reuses work from the
+    previous fit when the model allows it:
+
+    * if the model has a warm_start parameter (and is not an ensemble), it is
+      turned on, so that each fit starts from the previous solution, but
+      still runs to convergence on the whole prefix, like a normal fit
+    * otherwise, if the model has a partial_fit method (but no warm_start
+      parameter, like the naive Bayes classifiers, for which partial_fit on
+      successive batches is equivalent to fit), only the rows added since the
+      previous size are passed to partial_fit
+    * otherwise, the model is simply refit
+    '''
+    train_indices = _as_indices(train_indices)
+    if materializer is None:
+        test_X = X[test_indices, :]
+    else:
+        test_X = materializer.take_X(test_indices, 'test')
+    test_y = y[test_indices]
+    params = model.get_params() if hasattr(model, 'get_params') else {}
+    # for estimators with warm_start (e.g., SGDClassifier), partial_fit is a
+    # single pass, which would not match the results of a normal fit
+    incremental = hasattr(model, 'partial_fit') and 'warm_start' not in params
+    # for ensembles, warm_start means adding estimators, not reusing a solution
+    if 'warm_start' in params and 'n_estimators' not in params:
+        model.set_params(warm_start=True)
+    classes = np.unique(y)
+    reports = []
+    previous_size = 0
+    for train_size in train_sizes:
+        if incremental:
+            batch_indices = train_indices[previous_size:train_size]
+        else:
+            batch_indices = train_indices[:train_size]
+        if materializer is None:
+            batch_X, batch_y = X[batch_indices, :], y[batch_indices]
+        else:
+            batch_X, batch_y = materializer.take(batch_indices, 'train')
+        if incremental:
+            model.partial_fit(batch_X, batch_y, classes=classes)
+        else:
+            model.fit(batch_X, batch_y)
+        pred_y, pred_y_proba = _predict(model, test_X)
+        report = FoldMetrics().update(test_y, pred_y, pred_y_proba).report()
+        reports.append(dict(train=train_size, test=len(test_y), **report))
+        previous_size = train_size
+    return reports
+
+
+def train_test_report_iter(X, y, train_sizes, n_iter, Model, n_jobs=None, executor=None, splitter=None,
+                           learning_curve=False, batch_size=None):
     '''
     Run train_test_report for n_iter of each of the sizes in train_sizes.
     The yielded dict reports will include all the values of train_test_report's
@@ -90,12 +622,42 @@ def train_test_report_iter(X, y, train_sizes, n_iter, Model):
     Example:
         df = pd.DataFrame(train_test_report_iter(X, y, [10, 100, 1000], 10, Model))
 
-    Uses cross_validation.ShuffleSplit to pick random indices.
+    Uses PermutationSplit to pick random indices, unless splitter is given, in
+    which case n_iter is ignored. As with train_test_predictions_iter, splitter
+    can be a function from a train size to a splitter (see iter_folds), e.g.:
+        splitter = lambda train_size: model_selection.StratifiedShuffleSplit(10, train_size=train_size)
+    or a single splitter, which is then used as-is for every train size.
+
+    If learning_curve is True, each of the n_iter splits is made only once,
+    for the largest train size, and the smaller train sets are nested prefixes
+    of that one, all evaluated on the same test set (the complement of the
+    largest train set). Each model is then grown from the smallest size to the
+    largest with train_test_learning_curve, which reuses work through
+    partial_fit or warm_start where possible. Reports are yielded for each
+    split in turn, in order of ascending train size.
+
+    Set n_jobs to fit the folds (across all train sizes) in parallel
+    processes, or pass an executor; see _map_folds. Reports are still yielded
+    in order.
+
+    batch_size is passed along to train_test_report (it is ignored when
+    learning_curve is True).
     '''
-    for train_size in train_sizes:
-        # when test_size is None, the complement of train_size will be used.
-        folds = cross_validation.ShuffleSplit(len(y), n_iter=n_iter, train_size=train_size, test_size=None)
-        for _, (train_indices, test_indices) in enumerate(folds):
-            model = Model()
-            report = train_test_report(X, y, train_indices, test_indices, model)
-            yield dict(train=len(train_indices), test=len(test_indices), **report)
+    if splitter is None:
+        # the complement of train_size will be used as the test set
+        def splitter(train_size):
+            return PermutationSplit(n_iter, train_size=train_size)
+    if learning_curve:
+        sizes = sorted(_resolve_size(train_size, len(y)) for train_size in train_sizes)
+        folds = iter_folds(_splitter_for(splitter, sizes[-1]), X, y)
+        fold_function = partial(train_test_learning_curve, train_sizes=sizes)
+        for _, reports in _map_folds(fold_function, X, y, folds, Model, n_jobs, executor):
+            yield from reports
+        return
+    # drawn lazily, one train size (and one fold) at a time
+    folds = (fold
+             for train_size in train_sizes
+             for fold in iter_folds(_splitter_for(splitter, train_size), X, y))
+    fold_function = partial(train_test_report, batch_size=batch_size)
+    for (train_indices, test_indices), report in _map_folds(fold_function, X, y, folds, Model, n_jobs, executor):
+        yield dict(train=len(train_indices), test=len(test_indices), **report)
@@ -1,3 +1,9 @@
+import collections.abc
+import io
+import itertools
+import operator
+
+
 def td(html):
     return '<td>%s</td>' % html
 
@@ -25,6 +31,110 @@ _escape_html_translations = {
 def escape_html(string):
     return string.translate(_escape_html_translations)
 
+
+def _format_cell(value):
+    return escape_html(str(value))
+
+
+def _paginate(rows, page, page_size):
+    '''
+    Return the page-th (zero-indexed) page of page_size rows.
+    '''
+    start = page * page_size
+    if isinstance(rows, collections.abc.Sequence):
+        return rows[start:start + page_size]
+    return itertools.islice(rows, start, start + page_size)
+
+
+def _omitted_tr(count, colspan):
+    return '<tr><td colspan="%d" style="text-align: center">&hellip; %d rows omitted &hellip;</td></tr>' % (
+        colspan, count)
+
+
+def iter_table_html(rows, header=None, escape=True, max_rows=None, head=None, tail=None):
+    '''
+    Iterate over the fragments of an HTML table of rows (an iterable of
+    iterables of cells), one fragment per row, so that a large table can be
+    written out incrementally.
+
+    header: an optional list of column names
+    escape: if True, cells are converted with str() and HTML-escaped;
+        otherwise they are assumed to be HTML already
+    max_rows: if there are more rows than this, render only the first `head`
+        and the last `tail` of them (by default, half of max_rows each), with
+        a row noting how many were omitted in between. If rows is a sequence,
+        the omitted rows are never touched; otherwise, they are consumed, but
+        only the last `tail` rows are retained at any time.
+    '''
+    format_cell = _format_cell if escape else str
+    yield '<table>'
+    colspan = 1
+    if header is not None:
+        header = list(header)
+        colspan = max(len(header), 1)
+        yield tr(th(_format_cell(key)) for key in header)
+    tail_rows = ()
+    omitted = 0
+    if max_rows is not None:
+        if head is None:
+            head = (max_rows + 1) // 2
+        if tail is None:
+            tail = max_rows - head
+        if isinstance(rows, collections.abc.Sequence):
+            if len(rows) > head + tail:
+                omitted = len(rows) - head - tail
+                tail_rows = rows[len(rows) - tail:] if tail else ()
+                rows = rows[:head]
+        else:
+            rows = iter(rows)
+            head_rows = list(itertools.islice(rows, head))
+            tail_rows = collections.deque(maxlen=tail)
+            for row in rows:
+                if len(tail_rows) == tail:
+                    omitted += 1
+                tail_rows.append(row)
+            rows = head_rows
+    for row in rows:
+        yield tr(td(format_cell(cell)) for cell in row)
+    if omitted:
+        yield _omitted_tr(omitted, colspan)
+    for row in tail_rows:
+        yield tr(td(format_cell(cell)) for cell in row)
+    yield '</table>'
+
+
+def _render(fragments):
+    '''
+    Write all the fragments into a single buffer and return its contents.
+    '''
+    buffer = io.StringIO()
+    for fragment in fragments:
+        buffer.write(fragment)
+    return buffer.getvalue()
+
+
+class _LazyRows(collections.abc.Sequence):
+    '''
+    A sequence of length rows, where row i is get_row(i), computed only when
+    (and if) it's accessed.
+    '''
+    def __init__(self, length, get_row):
+        self.length = length
+        self.get_row = get_row
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.get_row(i) for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return self.get_row(index)
+
+
 # IPython notebook wrappers (display-ables)
 
 
@@ -35,29 +145,122 @@ class Table(object):
     E.g.:
 
         notebook.Table([('a', 'b'), ('c', 'd')])
+
+    Cells are HTML-escaped unless escape is False. At most max_rows rows are
+    rendered (None for no limit); see iter_table_html. If page_size is given,
+    only the page-th page of rows is shown.
     '''
-    def __init__(self, rows):
+    def __init__(self, rows, escape=True, max_rows=1000, page=0, page_size=None):
         self.rows = rows
+        self.escape = escape
+        self.max_rows = max_rows
+        self.page = page
+        self.page_size = page_size
+
+    def iter_html(self):
+        rows = self.rows
+        if self.page_size is not None:
+            rows = _paginate(rows, self.page, self.page_size)
+        return iter_table_html(rows, escape=self.escape, max_rows=self.max_rows)
 
     def _repr_html_(self):
-        return table(tr(td(cell) for cell in row) for row in self.rows)
+        return _render(self.iter_html())
+
+
+def _discover_keys(records):
+    '''
+    Return the list of all the keys in records (a sequence of dicts), in the
+    order they're first seen. Uniform records, which all have the same keys
+    as the first record, are detected with one (C-level) keys comparison per
+    record.
+    '''
+    if not records:
+        return []
+    first_keys = records[0].keys()
+    if all(record.keys() == first_keys for record in records):
+        return list(first_keys)
+    return list(dict.fromkeys(itertools.chain.from_iterable(records)))
 
 
 class DictTable(object):
     '''
-    records should be a list of dicts
+    records should be a list of dicts, a numpy record (structured) array, a
+    dict mapping column names to equal-length sequences of values (like
+    pandas' DataFrame constructor takes), or a pandas DataFrame; the latter
+    three are read column by column, without creating a dict per row.
+
+    If keys is not given, the columns are all the keys of all the records, in
+    the order they are first seen. Cells are extracted with a single
+    operator.itemgetter call per row, unless a record is missing some key.
+
+    Cells are HTML-escaped (missing values are shown as the `missing` HTML).
+    At most max_rows rows are rendered (None for no limit); see
+    iter_table_html. If page_size is given, only the page-th page of records
+    is shown.
     '''
-    def __init__(self, records, keys=None, missing='<i style="color: #AAA">NA</i>'):
+    def __init__(self, records, keys=None, missing='<i style="color: #AAA">NA</i>',
+                 max_rows=1000, page=0, page_size=None):
         self.records = records
         self.keys = keys
         self.missing = missing
+        self.max_rows = max_rows
+        self.page = page
+        self.page_size = page_size
 
-    def _repr_html_(self):
+    def _rows(self):
+        '''
+        Return a sequence (or iterable) of rows of HTML cells, and set
+        self.keys if it has not been set.
+        '''
+        records = self.records
+        if hasattr(records, 'columns') and not isinstance(records, collections.abc.Mapping):
+            # pandas DataFrame (or similar): read it as positional columns
+            records = {key: records[key].to_numpy() for key in records.columns}
+        if isinstance(records, collections.abc.Mapping):
+            # columns
+            if self.keys is None:
+                self.keys = list(records.keys())
+            columns = [records[key] for key in self.keys]
+            length = min(map(len, columns)) if columns else 0
+            return _LazyRows(length, lambda i: [_format_cell(column[i]) for column in columns])
+        dtype = getattr(records, 'dtype', None)
+        if dtype is not None and dtype.names is not None:
+            # numpy record array
+            if self.keys is None:
+                self.keys = list(dtype.names)
+            keys = self.keys
+            return _LazyRows(len(records), lambda i: [_format_cell(records[i][key]) for key in keys])
         if self.keys is None:
-            self.keys = set(key for record in self.records for key in record)
-        header_trs = [tr(th(key) for key in self.keys)]
-        body_trs = [tr(td(record.get(key, self.missing)) for key in self.keys) for record in self.records]
-        return table(header_trs + body_trs)
+            if not isinstance(records, collections.abc.Sequence):
+                # don't exhaust a one-shot iterable just to find the keys
+                records = list(records)
+            self.keys = _discover_keys(records)
+        keys = list(self.keys)
+        missing = self.missing
+        if not keys:
+            getter = lambda record: ()
+        elif len(keys) == 1:
+            getter = lambda record: (record[keys[0]],)
+        else:
+            getter = operator.itemgetter(*keys)
+
+        def format_record(record):
+            try:
+                return list(map(_format_cell, getter(record)))
+            except KeyError:
+                return [_format_cell(record[key]) if key in record else missing for key in keys]
+        if isinstance(records, collections.abc.Sequence):
+            return _LazyRows(len(records), lambda i: format_record(records[i]))
+        return map(format_record, records)
+
+    def iter_html(self):
+        rows = self._rows()
+        if self.page_size is not None:
+            rows = _paginate(rows, self.page, self.page_size)
+        return iter_table_html(rows, header=self.keys, escape=False, max_rows=self.max_rows)
+
+    def _repr_html_(self):
+        return _render(self.iter_html())
 
 
 class String(object):
@@ -3,31 +3,167 @@ import matplotlib.pyplot as plt
 import matplotlib.patheffects as PathEffects
 
 
+def _as_ints(data):
+    '''
+    Return data as an array of integers, which np.bincount requires: bools and
+    integral-valued floats are cast to int64. Returns None if data has any
+    other (e.g., fractional) values.
+    '''
+    data = np.asarray(data)
+    if data.dtype.kind in 'iu':
+        return data
+    if data.dtype.kind == 'b':
+        return data.astype(np.int64)
+    if data.dtype.kind == 'f' and np.array_equal(data, np.trunc(data)):
+        return data.astype(np.int64)
+    return None
+
+
+class IntHistogram(object):
+    '''
+    IntHistogram accumulates the counts of integer values with np.bincount,
+    one chunk at a time, so that data larger than memory (or spread across
+    several processes) can be histogrammed incrementally. Counts are stored
+    for the range [offset, offset + len(counts)), which grows as needed.
+
+    Use like:
+
+        histogram = IntHistogram()
+        for chunk in chunks:
+            histogram.update(chunk)
+        counts, bin_edges = histogram.counts, histogram.bin_edges
+
+    Histograms computed separately (e.g., over shards, in parallel) can be
+    combined with merge().
+    '''
+    def __init__(self, data=()):
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.update(data)
+
+    def __repr__(self):
+        return '<IntHistogram([{}, {}], total={})>'.format(self.min_value, self.max_value, self.counts.sum())
+
+    @property
+    def min_value(self):
+        return self.offset
+
+    @property
+    def max_value(self):
+        return self.offset + len(self.counts) - 1
+
+    @property
+    def bin_edges(self):
+        return np.arange(self.offset, self.offset + len(self.counts) + 1)
+
+    def _add_counts(self, offset, counts):
+        if len(counts) == 0:
+            return
+        if len(self.counts) == 0:
+            self.offset, self.counts = offset, counts.astype(np.int64)
+            return
+        start = min(self.offset, offset)
+        end = max(self.offset + len(self.counts), offset + len(counts))
+        if start != self.offset or end != self.offset + len(self.counts):
+            grown = np.zeros(end - start, dtype=np.int64)
+            grown[self.offset - start:self.offset - start + len(self.counts)] = self.counts
+            self.offset, self.counts = start, grown
+        self.counts[offset - self.offset:offset - self.offset + len(counts)] += counts
+
+    def update(self, data):
+        '''
+        Add the values in data (an array or iterable of ints) to the counts.
+        Returns self.
+        '''
+        data = np.asarray(data if hasattr(data, '__len__') else list(data))
+        if data.size:
+            ints = _as_ints(data)
+            if ints is None:
+                raise ValueError('IntHistogram can only count integer values')
+            data = ints.astype(np.int64, copy=False)
+            offset = int(data.min())
+            self._add_counts(offset, np.bincount((data - offset).ravel()))
+        return self
+
+    def merge(self, other):
+        '''
+        Add the counts from another IntHistogram. Returns self.
+        '''
+        self._add_counts(other.offset, other.counts)
+        return self
+
+
 def int_histogram(data, min_value=None, max_value=None):
     '''
     >>> int_histogram([1, 1, 2, 4], 1, 4)
     (array([2, 1, 0, 1]), array([1, 2, 3, 4, 5]))
     >>> int_histogram([1, 1, 2, 4])
     (array([2, 1, 0, 1]), array([1, 2, 3, 4, 5]))
+
+    Counts with np.bincount, which is linear in the size of data, rather than
+    binary-searching bins for each value like np.histogram. Values outside of
+    [min_value, max_value] are ignored. Data with fractional values (or
+    fractional bounds) falls back to np.histogram (with bins of width 1).
     '''
-    data = np.array(data)
+    data = np.asarray(data)
+    ints = _as_ints(data)
+    # as Python numbers, so that max_value + 2 can't overflow a small dtype
     if min_value is None:
-        min_value = data.min()
+        min_value = data.min().item()
     if max_value is None:
-        max_value = data.max()
-    bins = np.arange(min_value, max_value + 2)
-    return np.histogram(data, bins=bins)
+        max_value = data.max().item()
+    bin_edges = np.arange(min_value, max_value + 2)
+    if ints is None or min_value != int(min_value) or max_value != int(max_value):
+        return np.histogram(data, bins=bin_edges)
+    # count offsets in int64, so that small integer dtypes can't overflow
+    data = ints.astype(np.int64, copy=False)
+    min_value, max_value = int(min_value), int(max_value)
+    if data.min() < min_value or data.max() > max_value:
+        data = data[(data >= min_value) & (data <= max_value)]
+    counts = np.bincount(data - min_value, minlength=max_value - min_value + 1)
+    return counts, bin_edges
+
+
+def decimate_bars(counts, x, max_bars):
+    '''
+    If there are more than max_bars bars, sum consecutive runs of counts into
+    at most max_bars groups.
+
+    Returns:
+        A tuple of (counts, x, width), where x is the first value in each group
+        and width is the number of values in each group.
+    '''
+    counts = np.asarray(counts)
+    x = np.asarray(x)
+    if len(counts) <= max_bars:
+        return counts, x, 1
+    width = int(np.ceil(len(counts) / max_bars))
+    starts = np.arange(0, len(counts), width)
+    return np.add.reduceat(counts, starts), x[starts], width
 
 
-def plt_int_bar(counts, x, label_height=7, label_ha='center', label_va='bottom'):
+def plt_int_bar(counts, x, label_height=7, label_ha='center', label_va='bottom', max_bars=1000, max_labels=100):
     '''
     Args:
         counts: array of numbers
         x: an array of what each item in counts is counting (len(counts) == len(x))
+        max_bars: if there are more bars than this, aggregate neighboring bars
+            with decimate_bars
+        max_labels: only label the bars with their counts, and label every
+            tick, if there are at most this many bars; otherwise, leave the
+            ticks to matplotlib
     '''
+    counts, x, width = decimate_bars(counts, x, max_bars)
     # counts has length == bins, xs has length == (bins + 1), since it includes the right edge
     fig, ax = plt.subplots()
+    if width > 1:
+        # each bar covers [x, x + width)
+        plt.bar(x, counts, width=width, align='edge')
+        ax.set_xlabel('(bars aggregate groups of %d values)' % width)
+        return fig, ax
     plt.bar(x, counts)
+    if len(counts) > max_labels:
+        return fig, ax
     ticks = [patch.get_x() + patch.get_width() / 2 for patch in ax.patches]
     ax.set_xticks(ticks)
     labels = x.astype(int)
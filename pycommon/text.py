@@ -1,20 +1,151 @@
 import re
 import codecs
+from array import array
+import hashlib
+import json
+import os
 import os.path
+import tempfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 from .memo import memoized_property
 
 
+class Tokenizer(object):
+    '''
+    Tokenizer finds all the (non-overlapping) matches of a regular expression
+    pattern in a string, which is compiled once, when the Tokenizer is created.
+    Optionally, it lowercases the string first and/or drops stopwords.
+
+    E.g.:
+
+        tokenizer = Tokenizer(r'\\b\\w+\\b', lowercase=True, stopwords={'the'})
+        tokenizer.tokenize('The cat sat')  # -> ['cat', 'sat']
+    '''
+    def __init__(self, pattern, lowercase=False, stopwords=frozenset()):
+        self.regex = re.compile(pattern)
+        self.lowercase = lowercase
+        self.stopwords = frozenset(stopwords)
+
+    def __repr__(self):
+        return '<Tokenizer({pattern!r})>'.format(pattern=self.regex.pattern)
+
+    def tokenize(self, string):
+        '''
+        Return a list of all the tokens in string.
+        '''
+        if self.lowercase:
+            string = string.lower()
+        tokens = self.regex.findall(string)
+        if self.stopwords:
+            stopwords = self.stopwords
+            return [token for token in tokens if token not in stopwords]
+        return tokens
+
+    __call__ = tokenize
+
+    def iter_tokens(self, string):
+        '''
+        Like tokenize, but returns an iterator, which never builds the full
+        list of tokens.
+        '''
+        if self.lowercase:
+            string = string.lower()
+        stopwords = self.stopwords
+        for match in self.regex.finditer(string):
+            token = match.group()
+            if token not in stopwords:
+                yield token
+
+    def iter_tokens_from_chunks(self, chunks):
+        '''
+        Like iter_tokens, but over the concatenation of an iterable of string
+        chunks (e.g., successive pieces of a file), without ever joining them.
+        A match that reaches the end of a chunk might continue into the next
+        one, so it is held back and re-scanned along with the next chunk.
+
+        This assumes that the pattern matches maximal runs of characters (like
+        r'\\w+' or r'[-0-9A-Za-z_]+'), so that no match can span a gap of
+        non-matching characters.
+        '''
+        stopwords = self.stopwords
+        carry = ''
+        for chunk in chunks:
+            if self.lowercase:
+                chunk = chunk.lower()
+            buffer = carry + chunk
+            carry = ''
+            for match in self.regex.finditer(buffer):
+                if match.end() == len(buffer):
+                    carry = buffer[match.start():]
+                    break
+                token = match.group()
+                if token not in stopwords:
+                    yield token
+        # the final held-back match cannot be extended any further
+        if carry:
+            yield from self.iter_tokens(carry)
+
+    def tokenize_many(self, strings, n_jobs=None, chunksize=256):
+        '''
+        Tokenize each string in strings, returning an iterator over lists of
+        tokens, in the same order as strings.
+
+        If n_jobs is greater than 1, tokenize in a pool of that many processes,
+        sending the strings to workers `chunksize` at a time. Only a bounded
+        number of chunks (2 * n_jobs) are in flight at once, so strings is
+        consumed lazily, as results are consumed.
+        '''
+        if n_jobs is None or n_jobs == 1:
+            return map(self.tokenize, strings)
+        return self._tokenize_many_parallel(strings, n_jobs, chunksize)
+
+    def _tokenize_chunk(self, strings):
+        return [self.tokenize(string) for string in strings]
+
+    def _tokenize_many_parallel(self, strings, n_jobs, chunksize):
+        strings = iter(strings)
+        chunks = iter(lambda: list(islice(strings, chunksize)), [])
+        with ProcessPoolExecutor(n_jobs) as executor:
+            pending = deque(executor.submit(self._tokenize_chunk, chunk) for chunk in islice(chunks, 2 * n_jobs))
+            while pending:
+                tokens_lists = pending.popleft().result()
+                # refill the window before handing results back to the caller
+                for chunk in islice(chunks, 1):
+                    pending.append(executor.submit(self._tokenize_chunk, chunk))
+                yield from tokens_lists
+
+
+# the tokenizer used by TextFile by default
+word_tokenizer = Tokenizer(r'[-0-9A-Za-z_]+')
+
+
 class TextFile(object):
     '''
     TextFile is a representation of a text file on disk that memoizes (caches)
     most of its functionality.
 
-    TODO: abstract the tokenizer somehow
+    tokenizer can be any Tokenizer (or function from a string to a list of
+    tokens); it defaults to word_tokenizer.
+
+    If streaming is True, the file is never read into memory all at once:
+    tokens, token_set and token_counts are computed in a single pass over
+    iter_tokens(), which decodes the file chunk_size bytes at a time. (In this
+    case, tokenizer must be a Tokenizer.)
     '''
-    def __init__(self, filepath, encoding='utf-8'):
+    def __init__(self, filepath, encoding='utf-8', tokenizer=word_tokenizer, streaming=False, chunk_size=1 << 20):
         self.filepath = filepath
         self.encoding = encoding
+        self.tokenizer = tokenizer
+        self.streaming = streaming
+        self.chunk_size = chunk_size
 
     @memoized_property
     def filename(self):
@@ -28,18 +159,241 @@ class TextFile(object):
     def string(self):
         return codecs.open(self.filepath, encoding=self.encoding).read()
 
+    def iter_chunks(self):
+        '''
+        Iterate over the decoded contents of the file, reading chunk_size bytes
+        at a time, and decoding them incrementally so that multi-byte
+        characters split across chunks are handled correctly.
+        '''
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        with open(self.filepath, 'rb') as fp:
+            for data in iter(lambda: fp.read(self.chunk_size), b''):
+                chunk = decoder.decode(data)
+                if chunk:
+                    yield chunk
+        chunk = decoder.decode(b'', final=True)
+        if chunk:
+            yield chunk
+
+    def iter_tokens(self):
+        '''
+        Lazily iterate over the tokens in the file without reading it all into
+        memory (or memoizing anything).
+        '''
+        return self.tokenizer.iter_tokens_from_chunks(self.iter_chunks())
+
     @memoized_property
     def tokens(self):
-        return re.findall(r'[-0-9A-Za-z_]+', self.string)
+        if self.streaming:
+            return list(self.iter_tokens())
+        return self.tokenizer(self.string)
 
     @memoized_property
     def token_set(self):
+        if self.streaming:
+            return set(self.iter_tokens())
         return set(self.tokens)
 
+    @memoized_property
+    def token_counts(self):
+        if self.streaming:
+            return Counter(self.iter_tokens())
+        return Counter(self.tokens)
+
     def __repr__(self):
         return '<TextFile({filepath})>'.format(filepath=self.filepath)
 
 
+def _write_atomically(path, write):
+    '''
+    Call write(fp) on a temporary file in the same directory as path, then
+    move it into place, so that readers never see a partially written file.
+    '''
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            write(fp)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class TextCorpus(object):
+    '''
+    TextCorpus is a collection of TextFiles that share a single vocabulary, with
+    an optional on-disk cache of each file's tokens, so that repeated runs only
+    re-tokenize the files that have changed.
+
+    In cache_dir, the vocabulary is stored as a JSON list of tokens (only ever
+    appended to, so ids never change), and each file's tokens are stored as a
+    numpy array of vocabulary ids in an .npz file, along with the file's
+    fingerprint and a description of the tokenizer. The fingerprint is the
+    file's size and modification time, or, if hash_contents is True, its size
+    and SHA-1 digest (which costs a read, but no tokenization).
+
+    Each .npz file also records the size and a digest of the vocabulary its ids
+    refer to, so if another process sharing cache_dir has overwritten the
+    vocabulary with a different one, the file is re-tokenized rather than
+    mapped to the wrong tokens.
+
+    E.g.:
+
+        corpus = TextCorpus(glob.glob('logs/*.txt'), cache_dir='.token_cache')
+        corpus.update()
+        corpus.token_set('logs/a.txt')
+
+    Requires numpy.
+    '''
+    def __init__(self, filepaths, cache_dir=None, encoding='utf-8', tokenizer=word_tokenizer, hash_contents=False):
+        if np is None:
+            raise ImportError('TextCorpus requires numpy')
+        self.text_files = [TextFile(filepath, encoding, tokenizer, streaming=True) for filepath in filepaths]
+        self.cache_dir = cache_dir
+        self.tokenizer = tokenizer
+        self.hash_contents = hash_contents
+        self.vocab = []
+        self.vocab_ids = {}
+        self._token_ids = {}
+        self._vocab_digests = {}
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            if os.path.exists(self._vocab_path):
+                with open(self._vocab_path, encoding='utf-8') as fp:
+                    self.vocab = json.load(fp)
+                self.vocab_ids = {token: token_id for token_id, token in enumerate(self.vocab)}
+
+    def __len__(self):
+        return len(self.text_files)
+
+    def __iter__(self):
+        return iter(self.text_files)
+
+    def __repr__(self):
+        return '<TextCorpus({size} files)>'.format(size=len(self.text_files))
+
+    @property
+    def _vocab_path(self):
+        return os.path.join(self.cache_dir, 'vocab.json')
+
+    @property
+    def _tokenizer_key(self):
+        tokenizer = self.tokenizer
+        if isinstance(tokenizer, Tokenizer):
+            return repr((tokenizer.regex.pattern, tokenizer.lowercase, sorted(tokenizer.stopwords)))
+        return repr(tokenizer)
+
+    def _cache_path(self, text_file):
+        digest = hashlib.sha1(os.path.abspath(text_file.filepath).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest + '.npz')
+
+    def _fingerprint(self, text_file):
+        stat = os.stat(text_file.filepath)
+        if not self.hash_contents:
+            return '{}:{}'.format(stat.st_size, stat.st_mtime_ns)
+        sha1 = hashlib.sha1()
+        with open(text_file.filepath, 'rb') as fp:
+            for data in iter(lambda: fp.read(1 << 20), b''):
+                sha1.update(data)
+        return '{}:{}'.format(stat.st_size, sha1.hexdigest())
+
+    def _vocab_digest(self, size):
+        '''
+        Return a digest of the first size tokens of the vocabulary, which, since
+        the vocabulary is only appended to, never changes once computed.
+        '''
+        digest = self._vocab_digests.get(size)
+        if digest is None:
+            sha1 = hashlib.sha1(json.dumps(self.vocab[:size]).encode('utf-8'))
+            digest = self._vocab_digests[size] = sha1.hexdigest()
+        return digest
+
+    def _load(self, text_file, fingerprint):
+        '''
+        Return the cached token ids for text_file, or None if they are missing
+        or stale.
+        '''
+        cache_path = self._cache_path(text_file)
+        if not os.path.exists(cache_path):
+            return None
+        with np.load(cache_path) as cached:
+            if 'vocab_digest' not in cached.files:
+                # written before vocabulary digests were recorded
+                return None
+            if str(cached['fingerprint']) != fingerprint or str(cached['tokenizer']) != self._tokenizer_key:
+                return None
+            vocab_size = int(cached['vocab_size'])
+            vocab_digest = str(cached['vocab_digest'])
+            token_ids = cached['token_ids']
+        if vocab_size > len(self.vocab) or self._vocab_digest(vocab_size) != vocab_digest:
+            return None
+        return token_ids
+
+    def _save(self, text_file, fingerprint, token_ids):
+        def write(fp):
+            np.savez(fp, token_ids=token_ids, fingerprint=np.str_(fingerprint), tokenizer=np.str_(self._tokenizer_key),
+                     vocab_size=len(self.vocab), vocab_digest=np.str_(self._vocab_digest(len(self.vocab))))
+        _write_atomically(self._cache_path(text_file), write)
+
+    def _tokenize(self, text_file):
+        vocab = self.vocab
+        vocab_ids = self.vocab_ids
+        token_ids = array('I')
+        for token in text_file.iter_tokens():
+            token_id = vocab_ids.get(token)
+            if token_id is None:
+                token_id = vocab_ids[token] = len(vocab)
+                vocab.append(token)
+            token_ids.append(token_id)
+        return np.frombuffer(token_ids, dtype=np.uint32)
+
+    def update(self):
+        '''
+        Make sure that the token ids of every file are available, loading them
+        from the cache when it's fresh, and tokenizing (and caching) otherwise.
+
+        Returns the list of TextFiles that had to be tokenized.
+        '''
+        tokenized = []
+        for text_file in self.text_files:
+            if text_file.filepath in self._token_ids:
+                continue
+            fingerprint = None
+            token_ids = None
+            if self.cache_dir is not None:
+                fingerprint = self._fingerprint(text_file)
+                token_ids = self._load(text_file, fingerprint)
+            if token_ids is None:
+                token_ids = self._tokenize(text_file)
+                tokenized.append((text_file, fingerprint, token_ids))
+            self._token_ids[text_file.filepath] = token_ids
+        if self.cache_dir is not None and tokenized:
+            # save the vocabulary before any token ids that refer to it
+            _write_atomically(self._vocab_path, lambda fp: fp.write(json.dumps(self.vocab).encode('utf-8')))
+            for text_file, fingerprint, token_ids in tokenized:
+                self._save(text_file, fingerprint, token_ids)
+        return [text_file for text_file, _, _ in tokenized]
+
+    def token_ids(self, filepath):
+        '''
+        Return a numpy array of the vocabulary ids of the tokens in filepath.
+        '''
+        if filepath not in self._token_ids:
+            self.update()
+        return self._token_ids[filepath]
+
+    def token_id_set(self, filepath):
+        return np.unique(self.token_ids(filepath))
+
+    def tokens(self, filepath):
+        vocab = self.vocab
+        return [vocab[token_id] for token_id in self.token_ids(filepath).tolist()]
+
+    def token_set(self, filepath):
+        vocab = self.vocab
+        return {vocab[token_id] for token_id in self.token_id_set(filepath).tolist()}
+
+
 _whitespace_chars = ['\t', '\n', '\x0b', '\x0c', '\r']  # ordinals: [9, 10, 11, 12, 13]
 _whitespace_mapping = str.maketrans({ord(char): ' ' for char in _whitespace_chars})
 
@@ -54,9 +408,16 @@ def normalize_whitespace(dirty_string):
 default_stopwords = frozenset({'and', 'of', 'in', 'the', 'for', 'a', 'on', 'to', 'with', 'an'})
 
 
+default_tokenizer = Tokenizer(r'\b\w+\b', lowercase=True, stopwords=default_stopwords)
+
+
 def tokenize(string, stopwords=default_stopwords):
     '''
     Lowercase string, then find all word fragments in it,
     where a word fragment is designated by r'\\b\\w+\\b'.
+
+    Uses default_tokenizer, unless other stopwords are given.
     '''
-    return [token for token in re.findall(r'\b\w+\b', string.lower()) if token not in stopwords]
+    if stopwords is default_stopwords:
+        return default_tokenizer.tokenize(string)
+    return Tokenizer(default_tokenizer.regex.pattern, lowercase=True, stopwords=stopwords).tokenize(string)